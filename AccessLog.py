@@ -0,0 +1,33 @@
+import json
+import logging
+import random
+
+
+class AccessLog:
+    """
+    One structured (JSON) log line per request - or per sampled request when sampleRate is below 1 -
+    with the URI, status, body size and duration, plus the request's timings when instrumentation is on.
+
+    Lines go to the "access" logger, which stays at INFO whatever LogLevel the rest of the function
+    runs at, so turning the chatter down doesn't lose the access log.
+    """
+    LOGGER = "access"
+
+    _sampleRate = 1.0
+
+    def __init__(self, sampleRate=1.0):
+        self._sampleRate = sampleRate
+        self._logger = logging.getLogger(self.LOGGER)
+        self._logger.setLevel(logging.INFO)
+
+    def sampled(self):
+        """Whether this request should be logged. Decide before building the record."""
+        if self._sampleRate >= 1:
+            return True
+        return self._sampleRate > 0 and random.random() < self._sampleRate
+
+    def log(self, record):
+        if self._sampleRate < 1:
+            # lets whoever reads the log scale counts back up
+            record["sampleRate"] = self._sampleRate
+        self._logger.info("%s", json.dumps(record, separators=(",", ":")))
@@ -0,0 +1,272 @@
+import gzip
+import logging
+import mimetypes
+import threading
+import time
+
+import oci
+
+from ObjectStore import StoredObject
+from Resilience import CircuitOpenError, describe, isRetryable
+
+# brotli is optional. Without it we can still serve precompressed .br objects, we just can't make our own.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# file extension of the precompressed sibling object for each encoding, in order of preference
+PRECOMPRESSED_EXTENSIONS = [("br", ".br"), ("gzip", ".gz")]
+
+COMPRESSIBLE_TYPES = (
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/xml",
+    "application/xhtml+xml",
+    "application/wasm",
+    "image/svg+xml",
+)
+
+
+def parseAcceptEncoding(header):
+    """Returns a dict of encoding => q value from an Accept-Encoding header."""
+    accepted = {}
+    if not header:
+        return accepted
+
+    for item in header.split(","):
+        parts = item.strip().split(";")
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def acceptableEncodings(header):
+    """The encodings we support that the client accepts, best first. Ties go to brotli."""
+    accepted = parseAcceptEncoding(header)
+    wildcard = accepted.get("*", 0.0)
+    encodings = []
+    for preference, (encoding, _) in enumerate(PRECOMPRESSED_EXTENSIONS):
+        q = accepted.get(encoding, wildcard)
+        if q > 0:
+            encodings.append((-q, preference, encoding))
+    return [encoding for _, _, encoding in sorted(encodings)]
+
+
+def isCompressible(contentType):
+    if not contentType:
+        return False
+    contentType = contentType.split(";")[0].strip().lower()
+    return contentType.startswith("text/") or contentType in COMPRESSIBLE_TYPES
+
+
+def compress(content, encoding):
+    if encoding == "gzip":
+        # mtime=0 so the same input always gives the same bytes
+        return gzip.compress(content, compresslevel=6, mtime=0)
+    if encoding == "br" and brotli:
+        return brotli.compress(content, quality=5)
+    return None
+
+
+def _weakETag(etag):
+    if not etag:
+        return None
+    if etag.startswith("W/"):
+        return etag
+    return 'W/"{}"'.format(etag.strip('"'))
+
+
+class ContentNegotiator:
+    """
+    Picks the best Content-Encoding for a request.
+
+    Precompressed siblings in the bucket (foo.js.br, foo.js.gz) are preferred. They are only looked for
+    when the object's type (guessed from its name) is worth compressing. Failing that compressible
+    objects between minBytes and maxBytes are compressed in process and the result kept in the object
+    cache, so each warm container only pays for compressing an object once.
+
+    Every encoded variant carries a weak version of the original object's ETag so that conditional
+    requests keep working against the original object's metadata.
+    """
+    _objectStore = None
+    _cache = None
+    _precompressed = False
+    _dynamic = True
+    _minBytes = 1024
+    _maxBytes = 4 * 1024 * 1024
+    _missingTTL = 60
+
+    # don't let the record of missing siblings grow without bound
+    MAX_MISSING = 4096
+
+    def __init__(self, objectStore, cache=None, precompressed=False, dynamic=True, minBytes=1024,
+                 maxBytes=4 * 1024 * 1024, missingTTL=60):
+        self._objectStore = objectStore
+        self._cache = cache
+        self._precompressed = precompressed
+        self._dynamic = dynamic
+        self._minBytes = minBytes
+        self._maxBytes = maxBytes
+        self._missingTTL = missingTTL
+
+        self._missing = {}
+        self._lock = threading.Lock()
+
+        if dynamic and not brotli:
+            logging.debug("brotli module not available, on the fly compression will use gzip only")
+
+    def _knownMissing(self, objectname):
+        with self._lock:
+            expires = self._missing.get(objectname)
+            if None == expires:
+                return False
+            if expires < time.monotonic():
+                del self._missing[objectname]
+                return False
+            return True
+
+    def _markMissing(self, objectname):
+        with self._lock:
+            if len(self._missing) >= self.MAX_MISSING:
+                self._missing.clear()
+            self._missing[objectname] = time.monotonic() + self._missingTTL
+
+    def _precompressedVariant(self, objectname, encodings):
+        if not isCompressible(mimetypes.guess_type(objectname)[0]):
+            # nobody precompresses images, video, etc. so don't go looking
+            return None
+
+        meta = None
+        for encoding, extension in PRECOMPRESSED_EXTENSIONS:
+            if not encoding in encodings:
+                continue
+            sibling = objectname + extension
+            if self._knownMissing(sibling):
+                continue
+            try:
+                variant = self._objectStore.getObject(sibling)
+            except Exception as e:
+                if isinstance(e, oci.exceptions.ServiceError) and 404 == e.status:
+                    logging.debug("No precompressed %s", sibling)
+                    self._markMissing(sibling)
+                    continue
+                if not (isinstance(e, CircuitOpenError) or isRetryable(e)):
+                    raise
+                # Object Storage is failing. The object itself may still be cached, so don't fail over a sibling
+                logging.debug("Could not look for %s (%s), serving %s as it is", sibling, describe(e), objectname)
+                return None
+
+            # the sibling's own Content-Type describes the compressed file, not what's inside it
+            if None == meta:
+                meta = self._objectStore.headObject(objectname)
+            return self._encoded(objectname, variant.content, meta, encoding)
+        return None
+
+    def _encoded(self, objectname, content, original, encoding):
+        obj = StoredObject(objectname, content, {})
+        obj.headers["Content-Type"] = original.getContentType() or mimetypes.guess_type(objectname)[0] or "application/octet-stream"
+        obj.headers["Content-Encoding"] = encoding
+        obj.headers["Content-Length"] = str(len(content))
+        for name in ("ETag", "Last-Modified"):
+            if original.headers.get(name):
+                obj.headers[name] = original.headers.get(name)
+        if obj.headers.get("ETag"):
+            obj.headers["ETag"] = _weakETag(obj.headers["ETag"])
+        obj.sourceETag = original.getETag()
+        return obj
+
+    def _dynamicVariant(self, original, encodings, cache=True):
+        if not self._minBytes <= original.size() <= self._maxBytes or not isCompressible(original.getContentType()):
+            return None
+        if original.headers.get("Content-Encoding"):
+            # stored already encoded
+            return None
+
+        for encoding in encodings:
+            key = self._objectStore.cacheKey(original.name) + (encoding,)
+            if cache and None != self._cache:
+                cached = self._cache.get(key)
+                if cached and cached.sourceETag == original.getETag():
+                    return cached
+
+            content = compress(original.content, encoding)
+            if None == content:
+                continue
+            if len(content) >= original.size():
+                # incompressible - not worth the Content-Encoding header
+                return None
+
+            logging.debug("Compressed %s with %s: %d -> %d bytes", original.name, encoding, original.size(), len(content))
+            encoded = self._encoded(original.name, content, original, encoding)
+            if cache and None != self._cache:
+                self._cache.put(key, encoded)
+            return encoded
+        return None
+
+    def getObject(self, objectname, acceptEncoding, original=None):
+        """
+        Returns the best representation of objectname for a client sending acceptEncoding.
+        original is the object itself, if the caller has already fetched it.
+        """
+        encodings = acceptableEncodings(acceptEncoding)
+
+        if encodings and self._precompressed:
+            variant = self._precompressedVariant(objectname, encodings)
+            if variant:
+                return variant
+
+        if None == original:
+            original = self._objectStore.getObject(objectname)
+        if encodings and self._dynamic:
+            variant = self._dynamicVariant(original, encodings)
+            if variant:
+                return variant
+        return original
+
+    def getETag(self, meta, acceptEncoding):
+        """
+        The ETag getObject's representation of meta's object would carry for a client sending
+        acceptEncoding, judged from the metadata alone: the weak form if it would be encoded.
+        A 304 has to carry the same one as the 200 would have.
+        """
+        encodings = acceptableEncodings(acceptEncoding)
+        etag = meta.getETag()
+        if not encodings or meta.headers.get("Content-Encoding"):
+            return etag
+
+        if self._precompressed and isCompressible(mimetypes.guess_type(meta.name)[0]):
+            # unless we already know there isn't, there may be a sibling. Not worth a request to find out
+            for encoding, extension in PRECOMPRESSED_EXTENSIONS:
+                if encoding in encodings and not self._knownMissing(meta.name + extension):
+                    return _weakETag(etag)
+
+        length = meta.headers.get("Content-Length")
+        size = int(length) if None != length else meta.size()
+        if (self._dynamic and (brotli or "gzip" in encodings) and self._minBytes <= size <= self._maxBytes
+                and isCompressible(meta.getContentType())):
+            return _weakETag(etag)
+        return etag
+
+    def encode(self, obj, acceptEncoding):
+        """
+        Compresses a representation that is only good for this one response (e.g. a personalised page).
+        Nothing is cached, as the next request would get a different body.
+        """
+        encodings = acceptableEncodings(acceptEncoding)
+        if encodings and self._dynamic:
+            variant = self._dynamicVariant(obj, encodings, cache=False)
+            if variant:
+                return variant
+        return obj
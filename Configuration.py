@@ -1,25 +1,114 @@
 import logging
 
+from PathMatcher import PathMatcher
+from Sites import SiteRouter
+
 
 class Configuration:
+    # access policies for path rules
+    AUTH_REQUIRED = "auth-required"
+    PUBLIC = "public"
+
+    # settings, environment variables and headers with any of these in their name are never logged
+    SECRET_WORDS = ("secret", "key", "token", "password", "pem", "rpst", "cookie", "authorization")
+    REDACTED = "********"
+
+    LOG_LEVELS = ("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG")
+
     _configOK = False
 
     _region = None
     _bucketName = None
+    _namespace = None
+
+    # other sites served by this function, by host and path prefix. Anything they don't cover
+    # is served from BucketName
+    _sites = None
+
+    # serve the "bucket" from a local directory instead of Object Storage. For tests and benchmarks only
+    _localBucketPath = None
+    _localLatencyMs = 0
+
+    # in-process object cache. CacheMaxBytes of 0 turns the cache off
+    _cacheMaxBytes = 32 * 1024 * 1024
+    _cacheMaxEntryBytes = 4 * 1024 * 1024
+    _cacheTTL = 60
+
+    # object bodies are read in chunks of StreamChunkBytes, and at most MaxBufferedBytes of them
+    # are held in memory at once by concurrent invocations. A larger object can only be served in byte ranges
+    _streamChunkBytes = 1024 * 1024
+    _maxBufferedBytes = 96 * 1024 * 1024
+
+    # calls to Object Storage: timeouts (seconds), retries of throttling / 5xx / timeouts, and the circuit
+    # breaker that stops calling it after that many failures in a row, for CircuitBreakerResetSeconds
+    _objectStorageConnectTimeout = 3
+    _objectStorageReadTimeout = 10
+    _objectStorageRetries = 2
+    _objectStorageRetryBackoffMs = 100
+    _circuitBreakerFailures = 5
+    _circuitBreakerResetSeconds = 30
+    # how long past CacheTTL a cached object can still be served when Object Storage is failing
+    _staleIfError = 24 * 60 * 60
+
+    # bucket manifest: "list" to index the bucket by listing it, or the name of a prebuilt manifest object.
+    # None means no manifest
+    _manifest = None
+    _manifestRefresh = 300
+
+    # objects to load into the cache when a container starts (see Prefetch.py)
+    _prefetchPaths = []
+    _prefetchMaxBytes = 8 * 1024 * 1024
+    _prefetchLinkedAssets = False
+
+    # size of the thread pool blocking calls are offloaded to by the async handler
+    _workerThreads = 4
+
+    # per request timing (Server-Timing header and timings in the access log)
+    _instrumentation = False
+
+    # None leaves the log level as the FDK set it
+    _logLevel = None
+    # fraction of requests that get an access log line
+    _accessLogSampleRate = 1.0
+
+    # content encoding
+    _compression = True
+    _precompressed = False
+    _compressionMinBytes = 1024
+    # anything bigger isn't compressed on the fly. Defaults to CacheMaxEntryBytes, as a bigger result
+    # couldn't be cached and would be compressed again for every request
+    _compressionMaxBytes = None
+
+    # Cache-Control policies to send to browsers, by path rule
+    _cacheControlRules = None
 
     _protectedPaths = []
+    _publicPaths = []
+    # access policy (AUTH_REQUIRED or PUBLIC) by path rule
+    _accessRules = None
 
     _idcsURL = None
     _clientID = None
     _clientSecret = None
-    # these are calculated
-    # they SHOULD come from the OpenID Connect discovery
-    # but I'm just calculating them directly myself
-    _azURL = None
-    _tokenURL = None
+    # how long to keep the OpenID discovery document and JWKS
+    _oidcMetadataTTL = 3600
+    # outbound calls to IDCS
+    _idcsConnectTimeout = 5
+    _idcsReadTimeout = 10
+    _idcsRetries = 2
+
+    # signed session cookies
+    _sessionKey = None
+    _sessionTTL = 3600
+
+    # fill in {{name}} etc. in protected HTML pages from the session (see Template.py)
+    _templates = False
 
     def __init__(self, configCtx):
         logging.debug("Processing configuration")
+        self._cacheControlRules = PathMatcher()
+        self._accessRules = PathMatcher()
+        self._sites = SiteRouter()
         try:
             logging.debug('Getting "BucketName" setting')
             self._bucketName = configCtx.get("BucketName")
@@ -34,6 +123,105 @@ class Configuration:
             else:
                 logging.debug("No Region setting. Will assume same region as Function is running within.")
 
+            # Namespace is optional too. Supplying it saves a call to Object Storage on cold start
+            if "Namespace" in configCtx:
+                self._namespace = configCtx.get("Namespace")
+                logging.info("Object Storage namespace set to {}".format(self._namespace))
+            else:
+                logging.debug("No Namespace setting. Will look it up.")
+
+            # Sites routes hosts (and path prefixes under them) to other buckets, see Sites.py
+            if "Sites" in configCtx:
+                self._sites.parse(configCtx.get("Sites"))
+                logging.info("Sites setting specifies {} routes".format(len(self._sites)))
+
+            # a local directory standing in for the bucket (see LocalObjectStorage.py)
+            if "LocalBucketPath" in configCtx:
+                self._localBucketPath = configCtx.get("LocalBucketPath")
+                logging.warning("Serving objects from local directory {} instead of Object Storage".format(self._localBucketPath))
+            self._localLatencyMs = self._getIntSetting(configCtx, "LocalLatencyMs", self._localLatencyMs)
+
+            # object cache sizing is optional - the defaults fit comfortably in a 256MB function
+            self._cacheMaxBytes = self._getIntSetting(configCtx, "CacheMaxBytes", self._cacheMaxBytes)
+            self._cacheMaxEntryBytes = self._getIntSetting(configCtx, "CacheMaxEntryBytes", self._cacheMaxEntryBytes)
+            self._cacheTTL = self._getIntSetting(configCtx, "CacheTTL", self._cacheTTL)
+
+            self._streamChunkBytes = self._getIntSetting(configCtx, "StreamChunkBytes", self._streamChunkBytes)
+            self._maxBufferedBytes = self._getIntSetting(configCtx, "MaxBufferedBytes", self._maxBufferedBytes)
+            if self._streamChunkBytes == 0:
+                logging.error('"StreamChunkBytes" setting must be greater than zero')
+                raise RuntimeError("Invalid StreamChunkBytes setting")
+
+            self._objectStorageConnectTimeout = self._getIntSetting(configCtx, "ObjectStorageConnectTimeout", self._objectStorageConnectTimeout)
+            self._objectStorageReadTimeout = self._getIntSetting(configCtx, "ObjectStorageReadTimeout", self._objectStorageReadTimeout)
+            if 0 == self._objectStorageConnectTimeout or 0 == self._objectStorageReadTimeout:
+                logging.error("Object Storage timeouts must be greater than zero")
+                raise RuntimeError("Invalid Object Storage timeout setting")
+            self._objectStorageRetries = self._getIntSetting(configCtx, "ObjectStorageRetries", self._objectStorageRetries)
+            self._objectStorageRetryBackoffMs = self._getIntSetting(configCtx, "ObjectStorageRetryBackoffMs", self._objectStorageRetryBackoffMs)
+            self._circuitBreakerFailures = self._getIntSetting(configCtx, "CircuitBreakerFailures", self._circuitBreakerFailures)
+            self._circuitBreakerResetSeconds = self._getIntSetting(configCtx, "CircuitBreakerResetSeconds", self._circuitBreakerResetSeconds)
+            self._staleIfError = self._getIntSetting(configCtx, "StaleIfError", self._staleIfError)
+
+            # an index of the bucket lets missing objects 404 without a call to Object Storage
+            if "Manifest" in configCtx and configCtx.get("Manifest").strip():
+                self._manifest = configCtx.get("Manifest").strip()
+                logging.info("Bucket manifest source set to {}".format(self._manifest))
+            else:
+                logging.debug("No Manifest setting. Every request goes to Object Storage.")
+            self._manifestRefresh = self._getIntSetting(configCtx, "ManifestRefresh", self._manifestRefresh)
+
+            # prefetch paths are a comma separated list of /object, /directory/ or /glob* entries
+            if "PrefetchPaths" in configCtx:
+                self._prefetchPaths = [path.strip() for path in configCtx.get("PrefetchPaths").split(",") if path.strip()]
+                for path in self._prefetchPaths:
+                    if not path.startswith("/"):
+                        logging.error('Prefetch path "{}" must start with /'.format(path))
+                        raise RuntimeError("Invalid PrefetchPaths setting")
+                logging.debug("Prefetch paths setting specifies {} paths".format(len(self._prefetchPaths)))
+            self._prefetchMaxBytes = self._getIntSetting(configCtx, "PrefetchMaxBytes", self._prefetchMaxBytes)
+            self._prefetchLinkedAssets = self._getBoolSetting(configCtx, "PrefetchLinkedAssets", self._prefetchLinkedAssets)
+
+            self._workerThreads = self._getIntSetting(configCtx, "WorkerThreads", self._workerThreads)
+            if self._workerThreads == 0:
+                logging.error('"WorkerThreads" setting must be greater than zero')
+                raise RuntimeError("Invalid WorkerThreads setting")
+
+            self._instrumentation = self._getBoolSetting(configCtx, "Instrumentation", self._instrumentation)
+
+            if "LogLevel" in configCtx:
+                self._logLevel = configCtx.get("LogLevel").strip().upper()
+                if not self._logLevel in self.LOG_LEVELS:
+                    logging.error('"LogLevel" setting must be one of {}'.format(", ".join(self.LOG_LEVELS)))
+                    raise RuntimeError("Invalid LogLevel setting")
+                logging.info("LogLevel set to {}".format(self._logLevel))
+
+            if "AccessLogSampleRate" in configCtx:
+                try:
+                    self._accessLogSampleRate = float(configCtx.get("AccessLogSampleRate"))
+                except ValueError:
+                    self._accessLogSampleRate = -1
+                if not 0 <= self._accessLogSampleRate <= 1:
+                    logging.error('"AccessLogSampleRate" setting must be between 0 and 1')
+                    raise RuntimeError("Invalid AccessLogSampleRate setting")
+                logging.info("AccessLogSampleRate set to {}".format(self._accessLogSampleRate))
+
+            # on the fly compression is on unless turned off. Looking for precompressed .br / .gz siblings
+            # costs an extra request per object (once per container) so it's off unless turned on
+            self._compression = self._getBoolSetting(configCtx, "Compression", self._compression)
+            self._precompressed = self._getBoolSetting(configCtx, "Precompressed", self._precompressed)
+            self._compressionMinBytes = self._getIntSetting(configCtx, "CompressionMinBytes", self._compressionMinBytes)
+            self._compressionMaxBytes = self._getIntSetting(configCtx, "CompressionMaxBytes", self._cacheMaxEntryBytes)
+
+            # Cache-Control policy is a ; separated list of rule=policy entries, e.g.
+            #   /assets/=public, max-age=86400;/assets/*.html=no-cache;/=no-cache
+            # rules are path prefixes, globs or re: regular expressions (see PathMatcher)
+            if not "CacheControl" in configCtx:
+                logging.debug("No Cache-Control policy")
+            else:
+                self._parseCacheControl(configCtx.get("CacheControl"))
+                logging.debug("Cache-Control setting specifies {} rules".format(len(self._cacheControlRules)))
+
             # the next few are optional but paired up
 
             # check for protected paths
@@ -43,18 +231,20 @@ class Configuration:
             else:
                 logging.debug("'ProtectedPaths' setting IS present.")
 
-                # protected paths in this implementation is just a comma separtated list of path prefixes
-                self._protectedPaths = configCtx.get("ProtectedPaths").split(",")
+                # protected paths is a comma separated list of path rules: prefixes, globs or re: regular
+                # expressions (see PathMatcher). Prefixes must start with / and though they probably
+                # should, they don't actually have to end with /
+                self._protectedPaths = [path.strip() for path in configCtx.get("ProtectedPaths").split(",") if path.strip()]
                 logging.debug("Protected paths setting specifies {} paths".format(len(self._protectedPaths)))
-                # sanity check on the paths - they must start with /
-                # though they probably should, they don't actually have to end with /
                 for path in self._protectedPaths:
-                    logging.debug('Checking that "{}" begins with "/"'.format( path ))
-                    if not path.startswith("/"):
-                        logging.error( "Path {} does not begin with / character".format( path ) )
-                        raise RuntimeError("Invalid path specified")
-                    else:
-                        logging.debug("path OK")
+                    self._accessRules.add(path, self.AUTH_REQUIRED)
+
+                # public paths carve exceptions out of protected areas, e.g. /members/signup.html
+                if "PublicPaths" in configCtx:
+                    self._publicPaths = [path.strip() for path in configCtx.get("PublicPaths").split(",") if path.strip()]
+                    logging.debug("Public paths setting specifies {} paths".format(len(self._publicPaths)))
+                    for path in self._publicPaths:
+                        self._accessRules.add(path, self.PUBLIC)
 
                 # if protected paths are specified we need 2 other settings:
                 # 1: IDCS URL
@@ -62,7 +252,7 @@ class Configuration:
                 #
                 # and we should have a client secret. More on that in a second
 
-                if not "ProtectedPaths" in configCtx:
+                if not "IDCSURL" in configCtx:
                     logging.debug('Missing "IDCSURL" setting')
                     raise RuntimeError("Missing IDCS URL")
 
@@ -71,19 +261,21 @@ class Configuration:
                 logging.info('IDCS URL set to "{}"'.format(self._idcsURL))
 
                 # then sanity check it
-                from urllib.parse import urlparse, urljoin
+                from urllib.parse import urlparse
                 try:
                     o = urlparse( self._idcsURL)
                 except:
                     logging.error("Failed to parse URL")
                     raise RuntimeError("Invalid URL")
 
-                # set AZ and Token URLs
-                self._azURL = urljoin(self._idcsURL, "/oauth2/v1/authorize")
-                self._tokenURL = urljoin(self._idcsURL, "/oauth2/v1/token")
+                # the Authorization and Token URLs come from OpenID Connect discovery (see OIDC.py),
+                # which is only fetched when the first user logs in. We just say how long to keep it.
+                self._oidcMetadataTTL = self._getIntSetting(configCtx, "OIDCMetadataTTL", self._oidcMetadataTTL)
 
-                logging.debug("Constructed Authorization URL {}".format(self._azURL))
-                logging.debug("Constructed Token URL {}".format(self._tokenURL))
+                # timeouts (seconds) and retries for calls to IDCS
+                self._idcsConnectTimeout = self._getIntSetting(configCtx, "IDCSConnectTimeout", self._idcsConnectTimeout)
+                self._idcsReadTimeout = self._getIntSetting(configCtx, "IDCSReadTimeout", self._idcsReadTimeout)
+                self._idcsRetries = self._getIntSetting(configCtx, "IDCSRetries", self._idcsRetries)
 
                 logging.debug("Getting ClientID setting")
                 self._clientID = configCtx.get("ClientID")
@@ -95,7 +287,23 @@ class Configuration:
                 # TODO: move that to a Vault
                 logging.debug("Getting ClientSecret setting")
                 self._clientSecret = configCtx.get("ClientSecret")
-                logging.info('OAuth Client Secret set to "{}"'.format(self._clientSecret))
+                logging.info("OAuth Client Secret {}".format("set" if self._clientSecret else "not set"))
+
+                # the session cookie signing key should be its own secret. If there isn't one we derive a key
+                # from the client secret so that every container running this function agrees on it
+                if "SessionKey" in configCtx:
+                    self._sessionKey = configCtx.get("SessionKey")
+                    logging.info("Session key set")
+                elif self._clientSecret:
+                    logging.info("No SessionKey setting. Deriving session key from the client secret.")
+                    import hashlib
+                    import hmac
+                    self._sessionKey = hmac.new(self._clientSecret.encode("utf-8"), b"demosite session key", hashlib.sha256).digest()
+                else:
+                    logging.warning("No SessionKey or ClientSecret setting. Sessions will not survive across containers.")
+                self._sessionTTL = self._getIntSetting(configCtx, "SessionTTL", self._sessionTTL)
+
+                self._templates = self._getBoolSetting(configCtx, "Templates", self._templates)
 
                 #TODO: add a check to verify the IDCS URL is good
                 #      WITHOUT taking too long
@@ -107,6 +315,61 @@ class Configuration:
             logging.critical('Exception: ' + str(e))
             logging.critical(e, exc_info=True)
 
+    def _getIntSetting(self, configCtx, name, default):
+        if not name in configCtx:
+            logging.debug('No "{}" setting. Using default of {}'.format(name, default))
+            return default
+
+        try:
+            value = int(configCtx.get(name))
+        except ValueError:
+            logging.error('"{}" setting must be a whole number'.format(name))
+            raise RuntimeError("Invalid {} setting".format(name))
+
+        if value < 0:
+            logging.error('"{}" setting must not be negative'.format(name))
+            raise RuntimeError("Invalid {} setting".format(name))
+
+        logging.info("{} set to {}".format(name, value))
+        return value
+
+    def _getBoolSetting(self, configCtx, name, default):
+        if not name in configCtx:
+            logging.debug('No "{}" setting. Using default of {}'.format(name, default))
+            return default
+
+        value = configCtx.get(name).strip().lower()
+        if value in ("true", "yes", "on", "1"):
+            result = True
+        elif value in ("false", "no", "off", "0"):
+            result = False
+        else:
+            logging.error('"{}" setting must be true or false'.format(name))
+            raise RuntimeError("Invalid {} setting".format(name))
+
+        logging.info("{} set to {}".format(name, result))
+        return result
+
+    def _parseCacheControl(self, setting):
+        for entry in setting.split(";"):
+            entry = entry.strip()
+            if not entry:
+                continue
+            if not "=" in entry:
+                logging.error('Cache-Control rule "{}" is not of the form rule=policy'.format(entry))
+                raise RuntimeError("Invalid CacheControl setting")
+
+            rule, policy = entry.split("=", 1)
+            self._cacheControlRules.add(rule, policy.strip())
+
+    @classmethod
+    def redacted(cls, name, value):
+        """value, unless name says it's a secret, in which case a placeholder. For logging and debug output."""
+        lowered = name.lower()
+        if value and any(word in lowered for word in cls.SECRET_WORDS):
+            return cls.REDACTED
+        return value
+
     def isConfigOK(self):
         return self._configOK
 
@@ -116,20 +379,137 @@ class Configuration:
     def getBucketName(self):
         return self._bucketName
 
+    def getNamespace(self):
+        return self._namespace
+
+    def getRoute(self, host, path):
+        """The Route for a request to another site, or None if it's for the default bucket."""
+        if not len(self._sites):
+            return None
+        return self._sites.match(host, path)
+
+    def getSiteRoutes(self):
+        return self._sites.getRoutes()
+
+    def getLocalBucketPath(self):
+        return self._localBucketPath
+
+    def getLocalLatencyMs(self):
+        return self._localLatencyMs
+
+    def cacheEnabled(self):
+        return self._cacheMaxBytes > 0
+
+    def getCacheMaxBytes(self):
+        return self._cacheMaxBytes
+
+    def getCacheMaxEntryBytes(self):
+        return self._cacheMaxEntryBytes
+
+    def getCacheTTL(self):
+        return self._cacheTTL
+
+    def getStreamChunkBytes(self):
+        return self._streamChunkBytes
+
+    def getMaxBufferedBytes(self):
+        return self._maxBufferedBytes
+
+    def getObjectStorageConnectTimeout(self):
+        return self._objectStorageConnectTimeout
+
+    def getObjectStorageReadTimeout(self):
+        return self._objectStorageReadTimeout
+
+    def getObjectStorageRetries(self):
+        return self._objectStorageRetries
+
+    def getObjectStorageRetryBackoffMs(self):
+        return self._objectStorageRetryBackoffMs
+
+    def getCircuitBreakerFailures(self):
+        return self._circuitBreakerFailures
+
+    def getCircuitBreakerResetSeconds(self):
+        return self._circuitBreakerResetSeconds
+
+    def getStaleIfError(self):
+        return self._staleIfError
+
+    def manifestEnabled(self):
+        return None != self._manifest
+
+    def getManifest(self):
+        return self._manifest
+
+    def getManifestRefresh(self):
+        return self._manifestRefresh
+
+    def prefetchEnabled(self):
+        return len(self._prefetchPaths) > 0 and self._prefetchMaxBytes > 0 and self.cacheEnabled()
+
+    def getPrefetchPaths(self):
+        return self._prefetchPaths
+
+    def getPrefetchMaxBytes(self):
+        return self._prefetchMaxBytes
+
+    def getPrefetchLinkedAssets(self):
+        return self._prefetchLinkedAssets
+
+    def getWorkerThreads(self):
+        return self._workerThreads
+
+    def instrumentationEnabled(self):
+        return self._instrumentation
+
+    def getLogLevel(self):
+        return self._logLevel
+
+    def getAccessLogSampleRate(self):
+        return self._accessLogSampleRate
+
+    def compressionEnabled(self):
+        return self._compression or self._precompressed
+
+    def getCompression(self):
+        return self._compression
+
+    def getPrecompressed(self):
+        return self._precompressed
+
+    def getCompressionMinBytes(self):
+        return self._compressionMinBytes
+
+    def getCompressionMaxBytes(self):
+        return self._compressionMaxBytes
+
+    def getCacheControl(self, path):
+        return self._cacheControlRules.match(path)
+
     def protectedPathsDefined(self):
         return len( self._protectedPaths ) > 0
 
     def getProtectedPaths(self):
         return self._protectedPaths
 
+    def getPublicPaths(self):
+        return self._publicPaths
+
     def getIDCSURL(self):
         return self._idcsURL
 
-    def getIDCSAuthorizationEndpoint(self):
-        return self._azURL
+    def getOIDCMetadataTTL(self):
+        return self._oidcMetadataTTL
 
-    def getIDCSTokenEndpoint(self):
-        return self._tokenURL
+    def getIDCSConnectTimeout(self):
+        return self._idcsConnectTimeout
+
+    def getIDCSReadTimeout(self):
+        return self._idcsReadTimeout
+
+    def getIDCSRetries(self):
+        return self._idcsRetries
 
     def getClientID(self):
         return self._clientID
@@ -137,15 +517,20 @@ class Configuration:
     def getClientSecret(self):
         return self._clientSecret
 
+    def getAccessPolicy(self, path):
+        return self._accessRules.match(path, self.PUBLIC)
+
+    def getSessionKey(self):
+        return self._sessionKey
+
+    def getSessionTTL(self):
+        return self._sessionTTL
+
+    def templatesEnabled(self):
+        return self._templates
+
     def isProtected(self, path):
-        for ppath in self._protectedPaths:
-            logging.debug('Checking {} against protected path "{}"'.format(path,ppath))
-            if path.startswith(ppath):
-                logging.debug("Protected!")
-                return True
-            else:
-                logging.debug("NOT protected")
-                return False
+        return self.getAccessPolicy(path) == self.AUTH_REQUIRED
 
 # import pytest
 # @pytest.mark
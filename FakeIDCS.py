@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import jwt
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+ISSUER = "https://identity.oraclecloud.com/"
+DISCOVERY_PATH = "/.well-known/openid-configuration"
+
+
+class FakeIDCS:
+    """
+    A local stand-in for IDCS, for tests and benchmarks. It serves the OpenID discovery document, the
+    JWKS and a token endpoint, and counts the requests made to each path.
+
+    The token endpoint accepts any authorization code and returns an ID token whose subject is the
+    code, signed with the first key added - so a callback with ?code=alice logs in as alice.
+    """
+
+    def __init__(self, clientID, delay=0):
+        self.clientID = clientID
+        self.keys = {}
+        self.requests = {}
+        self.delay = delay
+        self._lock = threading.Lock()
+        idp = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, like the real thing
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, body):
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                idp.count(self.path, True)
+                time.sleep(idp.delay)
+                if self.path == DISCOVERY_PATH:
+                    self._send({
+                        "issuer": ISSUER,
+                        "authorization_endpoint": idp.url + "/oauth2/v1/authorize",
+                        "token_endpoint": idp.url + "/oauth2/v1/token",
+                        "jwks_uri": idp.url + "/jwks",
+                    })
+                elif self.path == "/jwks":
+                    self._send({"keys": [idp.jwk(kid, key) for kid, key in list(idp.keys.items())]})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                idp.count(self.path, True)
+                form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+                time.sleep(idp.delay)
+                if self.path != "/oauth2/v1/token" or not form.get("code"):
+                    self.send_error(400)
+                    return
+                kid = next(iter(idp.keys))
+                self._send({
+                    "access_token": "not-a-real-token",
+                    "token_type": "Bearer",
+                    "expires_in": 3600,
+                    "id_token": idp.idToken(kid, sub=form["code"][0], name=form["code"][0].title()),
+                })
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def addKey(self, kid):
+        self.keys[kid] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        return self.keys[kid]
+
+    def jwk(self, kid, key):
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+        jwk.update({"kid": kid, "alg": "RS256", "use": "sig"})
+        return jwk
+
+    def idToken(self, kid, key=None, **claims):
+        now = int(time.time())
+        body = {"sub": "alice", "aud": self.clientID, "iss": ISSUER, "iat": now, "exp": now + 300}
+        body.update(claims)
+        return jwt.encode(body, key or self.keys[kid], algorithm="RS256", headers={"kid": kid})
+
+    def count(self, path, increment=False):
+        with self._lock:
+            if increment:
+                self.requests[path] = self.requests.get(path, 0) + 1
+            return self.requests.get(path, 0)
+
+    def shutdown(self):
+        self.server.shutdown()
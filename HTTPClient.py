@@ -0,0 +1,81 @@
+import logging
+import threading
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HTTPClient:
+    """
+    A pooled, keep-alive HTTP session for outbound calls to the identity provider.
+
+    One of these is shared by every invocation a warm container handles (see getClient), so logins
+    after the first reuse an open TLS connection instead of doing a fresh TCP + TLS handshake.
+
+    Failed connections are retried with exponential backoff for any method (nothing was sent).
+    Error statuses are only retried for GETs - the token exchange POST spends a one time
+    authorization code so retrying it after IDCS has seen it would only ever fail.
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, connectTimeout=5, readTimeout=10, retries=2, backoff=0.3, poolSize=4):
+        self._timeout = (connectTimeout, readTimeout)
+        self._session = requests.Session()
+
+        retry = Retry(total=retries,
+                      connect=retries,
+                      read=retries,
+                      status=retries,
+                      backoff_factor=backoff,
+                      status_forcelist=self.RETRY_STATUSES,
+                      allowed_methods=frozenset(["GET", "HEAD"]),
+                      raise_on_status=False)
+        self._adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=retry)
+        self._session.mount("https://", self._adapter)
+        self._session.mount("http://", self._adapter)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self._timeout)
+        return self._session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault("timeout", self._timeout)
+        return self._session.post(url, **kwargs)
+
+    def getStats(self):
+        """Requests sent and connections opened, across all the hosts we've talked to."""
+        stats = {"requests": 0, "connections": 0}
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if None == pool:
+                continue
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+        stats["reused"] = stats["requests"] - stats["connections"]
+        return stats
+
+
+_client = None
+_clientLock = threading.Lock()
+
+
+def configure(connectTimeout, readTimeout, retries):
+    """Replaces the shared client with one using these settings."""
+    global _client
+    logging.debug("Outbound HTTP: connect timeout {}s, read timeout {}s, {} retries".format(connectTimeout, readTimeout, retries))
+    with _clientLock:
+        _client = HTTPClient(connectTimeout, readTimeout, retries)
+    return _client
+
+
+def getClient():
+    """The shared client, created with default settings if nothing has configured it."""
+    global _client
+    if None == _client:
+        with _clientLock:
+            if None == _client:
+                _client = HTTPClient()
+    return _client
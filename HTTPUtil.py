@@ -0,0 +1,211 @@
+import logging
+import os
+
+from email.utils import parsedate_to_datetime
+
+# more ranges than this in one request is almost certainly abuse, not a media player
+MAX_RANGES = 16
+
+
+def getHeader(headers, name):
+    """
+    Returns a request header from the FDK's (lower cased) header dict.
+    Headers sent more than once arrive as a list - we join those the way HTTP says we can.
+    """
+    value = headers.get(name.lower())
+    if isinstance(value, list):
+        value = ", ".join(value)
+    return value
+
+
+def getCookie(headers, name):
+    """Returns the value of the named cookie from the request's Cookie header(s), or None."""
+    cookieHeader = getHeader(headers, "Cookie")
+    if not cookieHeader:
+        return None
+
+    # multiple Cookie headers were joined with ", " by getHeader
+    for cookie in cookieHeader.replace(", ", "; ").split(";"):
+        key, _, value = cookie.strip().partition("=")
+        if key == name:
+            return value
+    return None
+
+
+def _normalizeETag(etag):
+    etag = etag.strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    return etag.strip('"')
+
+
+def _etagMatches(ifNoneMatch, etag):
+    if ifNoneMatch.strip() == "*":
+        return True
+
+    etag = _normalizeETag(etag)
+    for candidate in ifNoneMatch.split(","):
+        if _normalizeETag(candidate) == etag:
+            return True
+    return False
+
+
+def _parseHTTPDate(value):
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def isNotModified(requestHeaders, obj):
+    """
+    Decides whether a GET / HEAD can be answered with a 304 given the request headers and the object's metadata.
+
+    If-None-Match wins over If-Modified-Since when both are present (RFC 7232 section 6).
+    """
+    ifNoneMatch = getHeader(requestHeaders, "If-None-Match")
+    etag = obj.headers.get("ETag")
+    if ifNoneMatch:
+        return etag is not None and _etagMatches(ifNoneMatch, etag)
+
+    ifModifiedSince = getHeader(requestHeaders, "If-Modified-Since")
+    lastModified = obj.headers.get("Last-Modified")
+    if ifModifiedSince and lastModified:
+        since = _parseHTTPDate(ifModifiedSince)
+        modified = _parseHTTPDate(lastModified)
+        if since is None or modified is None:
+            logging.debug("Could not parse If-Modified-Since / Last-Modified dates")
+            return False
+        return modified <= since
+
+    return False
+
+
+def isConditional(requestHeaders):
+    return bool(getHeader(requestHeaders, "If-None-Match") or getHeader(requestHeaders, "If-Modified-Since"))
+
+
+def validatorHeaders(obj, cacheControl=None):
+    """The headers that let a client revalidate what we send it."""
+    headers = {}
+    for name in ("ETag", "Last-Modified"):
+        value = obj.headers.get(name)
+        if value:
+            headers[name] = value
+    if cacheControl:
+        headers["Cache-Control"] = cacheControl
+    return headers
+
+
+def privateCacheControl(cacheControl):
+    """
+    cacheControl for a response only the signed in user should see: public becomes private (or private
+    is added) so a shared cache, like the API Gateway's or a CDN, doesn't keep it for everyone else.
+    """
+    directives = [d.strip() for d in (cacheControl or "").split(",") if d.strip()]
+    return ", ".join(["private"] + [d for d in directives if not d.lower() in ("public", "private")])
+
+
+def objectHeaders(obj, cacheControl=None):
+    """Full set of headers for a 200 response serving obj."""
+    headers = validatorHeaders(obj, cacheControl)
+    headers["Content-Type"] = obj.getContentType()
+    headers["Accept-Ranges"] = "bytes"
+    if obj.headers.get("Content-Encoding"):
+        headers["Content-Encoding"] = obj.headers.get("Content-Encoding")
+    length = obj.headers.get("Content-Length")
+    if obj.content is not None:
+        length = len(obj.content)
+    if length is not None:
+        headers["Content-Length"] = str(length)
+    return headers
+
+
+def parseRange(rangeHeader, size):
+    """
+    Parses a Range header against an object of the given size.
+
+    Returns None if the header should be ignored (missing, malformed or not in bytes),
+    an empty list if none of the ranges can be satisfied (i.e. 416),
+    otherwise a sorted list of non-overlapping (start, end) pairs with end inclusive.
+    """
+    if not rangeHeader:
+        return None
+
+    unit, _, spec = rangeHeader.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        if not dash:
+            return None
+        try:
+            if first == "":
+                # suffix range: the last N bytes
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+        except ValueError:
+            return None
+
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    # merge overlapping and adjacent ranges so we never fetch the same bytes twice
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        logging.info("Too many ranges requested (%d)", len(merged))
+        return []
+    return merged
+
+
+def rangeStillValid(requestHeaders, obj):
+    """If-Range: only honour the Range header if the client's copy is still the current one."""
+    ifRange = getHeader(requestHeaders, "If-Range")
+    if not ifRange:
+        return True
+    ifRange = ifRange.strip()
+    if ifRange == obj.headers.get("Last-Modified"):
+        return True
+    # weak validators never match here
+    etag = obj.headers.get("ETag")
+    return etag is not None and not ifRange.startswith("W/") and _normalizeETag(ifRange) == _normalizeETag(etag)
+
+
+def contentRange(start, end, size):
+    return "bytes {}-{}/{}".format(start, end, size)
+
+
+def multipartByteRanges(parts, contentType, size):
+    """
+    Builds a multipart/byteranges body from (start, end, bytes) parts.
+    Returns the body and the Content-Type header value to send with it.
+    """
+    boundary = os.urandom(12).hex()
+    chunks = []
+    for start, end, content in parts:
+        chunks.append("--{}\r\nContent-Type: {}\r\nContent-Range: {}\r\n\r\n".format(
+            boundary, contentType, contentRange(start, end, size)).encode())
+        chunks.append(content)
+        chunks.append(b"\r\n")
+    chunks.append("--{}--\r\n".format(boundary).encode())
+    return b"".join(chunks), "multipart/byteranges; boundary=" + boundary
@@ -0,0 +1,147 @@
+import datetime
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import oci
+
+from requests.structures import CaseInsensitiveDict
+
+
+class _Body:
+    """Stands in for the urllib3 response the SDK hands back as obj.data.raw."""
+    def __init__(self, content):
+        self._content = content
+
+    def stream(self, chunkSize, decode_content=True):
+        view = memoryview(self._content)
+        for offset in range(0, len(self._content), chunkSize):
+            yield bytes(view[offset:offset + chunkSize])
+
+    def close(self):
+        pass
+
+
+class LocalObjectStorageClient:
+    """
+    A stand-in for oci.object_storage.ObjectStorageClient serving a bucket from a local directory, or
+    from a dict of name => bytes, for tests and benchmarks (see bench.py).
+
+    It implements the calls ObjectStore makes - get_object, head_object, list_objects and get_namespace -
+    with Object Storage's behaviour for the parts we rely on: ETags, If-None-Match (304), byte ranges
+    and 404s, all raised as ServiceErrors the way the SDK does. Every call waits latency seconds first
+    to stand in for the round trip, and is counted (see getStats).
+    """
+    _root = None
+    _latency = 0.0
+    _namespace = "local"
+
+    def __init__(self, root=None, objects=None, latency=0.0, namespace="local"):
+        self._root = root
+        self._objects = objects
+        self._latency = latency
+        self._namespace = namespace
+
+        # ETags for files, by path, as long as their size and mtime don't change
+        self._etags = {}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        with self._lock:
+            self._calls[operation] = self._calls.get(operation, 0) + 1
+        if self._latency:
+            time.sleep(self._latency)
+
+    def _names(self):
+        if None != self._objects:
+            return sorted(self._objects)
+        names = []
+        for directory, _, files in os.walk(self._root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                names.append(os.path.relpath(path, self._root).replace(os.sep, "/"))
+        return sorted(names)
+
+    def _load(self, objectname):
+        """Returns (content, etag, modified) or raises a 404 ServiceError."""
+        if None != self._objects:
+            content = self._objects.get(objectname)
+            if None == content:
+                raise oci.exceptions.ServiceError(404, "ObjectNotFound", {}, "The object '{}' was not found".format(objectname))
+            return content, hashlib.md5(content).hexdigest(), datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+
+        path = os.path.realpath(os.path.join(self._root, objectname))
+        if not path.startswith(os.path.realpath(self._root) + os.sep) or not os.path.isfile(path):
+            raise oci.exceptions.ServiceError(404, "ObjectNotFound", {}, "The object '{}' was not found".format(objectname))
+
+        with open(path, "rb") as f:
+            content = f.read()
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._etags.get(path)
+        if None == cached or cached[0] != key:
+            cached = (key, hashlib.md5(content).hexdigest())
+            with self._lock:
+                self._etags[path] = cached
+        return content, cached[1], datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc)
+
+    def _response(self, objectname, if_none_match=None, range=None, withBody=True):
+        content, etag, modified = self._load(objectname)
+        if None != if_none_match and if_none_match == etag:
+            raise oci.exceptions.ServiceError(304, "NotModified", {}, "The object '{}' was not modified".format(objectname))
+
+        headers = CaseInsensitiveDict({
+            "ETag": etag,
+            "Content-Type": mimetypes.guess_type(objectname)[0] or "application/octet-stream",
+            "Last-Modified": format_datetime(modified, usegmt=True),
+            "Accept-Ranges": "bytes",
+        })
+        status = 200
+        if None != range:
+            start, _, end = range[len("bytes="):].partition("-")
+            start, end = int(start), min(int(end), len(content) - 1)
+            if start >= len(content):
+                raise oci.exceptions.ServiceError(416, "InvalidRange", {}, "The requested range is not satisfiable")
+            headers["Content-Range"] = "bytes {}-{}/{}".format(start, end, len(content))
+            content = content[start:end + 1]
+            status = 206
+        headers["Content-Length"] = str(len(content))
+
+        return SimpleNamespace(status=status, headers=headers,
+                               data=SimpleNamespace(raw=_Body(content)) if withBody else None)
+
+    def get_namespace(self, **kwargs):
+        self._call("get_namespace")
+        return SimpleNamespace(status=200, headers={}, data=self._namespace)
+
+    def get_object(self, namespace_name, bucket_name, object_name, if_none_match=None, range=None, **kwargs):
+        self._call("get_object")
+        return self._response(object_name, if_none_match, range)
+
+    def head_object(self, namespace_name, bucket_name, object_name, if_none_match=None, **kwargs):
+        self._call("head_object")
+        return self._response(object_name, if_none_match, withBody=False)
+
+    def list_objects(self, namespace_name, bucket_name, prefix=None, start=None, limit=1000, fields=None, **kwargs):
+        self._call("list_objects")
+        names = [name for name in self._names() if name.startswith(prefix or "") and (None == start or name >= start)]
+
+        summaries = []
+        for name in names[:limit]:
+            content, etag, modified = self._load(name)
+            summaries.append(oci.object_storage.models.ObjectSummary(name=name, size=len(content), etag=etag, time_modified=modified))
+        page = oci.object_storage.models.ListObjects(objects=summaries, prefixes=[],
+                                                     next_start_with=names[limit] if len(names) > limit else None)
+        return SimpleNamespace(status=200, headers={}, data=page)
+
+    def getStats(self):
+        """Calls made, by operation."""
+        with self._lock:
+            return dict(self._calls)
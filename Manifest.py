@@ -0,0 +1,162 @@
+import json
+import logging
+import mimetypes
+import threading
+import time
+
+from email.utils import format_datetime
+
+from ObjectStore import StoredObject
+
+
+class BucketManifest:
+    """
+    An in-memory index of every object in the bucket: name, size, ETag, Content-Type and Last-Modified.
+
+    With it a warm container knows whether an object exists, and what its metadata is, without asking
+    Object Storage. That makes 404s free, lets foo be redirected to foo/ when foo/index.html exists and
+    answers HEAD and conditional requests with no network call.
+
+    The index comes from one of two places:
+      - a listing of the bucket (source LIST), which can't tell us Content-Type so that is guessed
+        from the name
+      - a prebuilt manifest object in the bucket, which is JSON of the form
+          {"objects": [{"name": "index.html", "size": 1234, "etag": "...",
+                        "contentType": "text/html", "lastModified": "Tue, 01 Jun 2021 10:00:00 GMT"}, ...]}
+        Only name is required, but an object listed without a size has to be asked about (a HEAD
+        request) when its size is needed. The manifest is only downloaded again when its ETag changes.
+
+    Loading happens on a background thread (see start) and is refreshed every refreshInterval seconds.
+    Until the first load finishes isLoaded() is False and callers should behave as if there were no
+    manifest. Objects uploaded since the last refresh will look missing until the next one.
+    """
+    LIST = "list"
+
+    _objectStore = None
+    _source = LIST
+    _refreshInterval = 300
+
+    def __init__(self, objectStore, source=LIST, refreshInterval=300):
+        self._objectStore = objectStore
+        self._source = source
+        self._refreshInterval = refreshInterval
+
+        # name => (size, etag, content type, last modified). Replaced wholesale on refresh
+        self._entries = None
+        self._loaded = 0
+        self._manifestETag = None
+        self._refreshes = 0
+        self._failures = 0
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _fromListing(self):
+        entries = {}
+        for summary in self._objectStore.listObjects():
+            lastModified = None
+            if summary.time_modified:
+                lastModified = format_datetime(summary.time_modified, usegmt=True)
+            previous = self._entries.get(summary.name) if self._entries else None
+            if previous and previous[1] == summary.etag and previous[3] == lastModified:
+                # unchanged - keep the tuple we already have rather than building an equal one
+                entries[summary.name] = previous
+                continue
+            contentType = mimetypes.guess_type(summary.name)[0] or "application/octet-stream"
+            entries[summary.name] = (summary.size, summary.etag, contentType, lastModified)
+        return entries
+
+    def _fromManifestObject(self):
+        meta = self._objectStore.headObject(self._source)
+        if None != self._entries and meta.getETag() and meta.getETag() == self._manifestETag:
+            logging.debug("Manifest {} unchanged".format(self._source))
+            return self._entries
+
+        obj = self._objectStore.getObject(self._source)
+        document = json.loads(bytes(obj.content).decode("utf-8"))
+        entries = {}
+        for item in document.get("objects", []):
+            name = item["name"]
+            contentType = item.get("contentType") or mimetypes.guess_type(name)[0] or "application/octet-stream"
+            entries[name] = (item.get("size"), item.get("etag"), contentType, item.get("lastModified"))
+        self._manifestETag = obj.getETag()
+        return entries
+
+    def refresh(self):
+        """Rebuilds the index now. On failure the previous index (if any) is kept."""
+        started = time.perf_counter()
+        try:
+            if self._source == self.LIST:
+                entries = self._fromListing()
+            else:
+                entries = self._fromManifestObject()
+        except (Exception) as e:
+            self._failures += 1
+            logging.error("Failed to load bucket manifest: {}".format(e))
+            return False
+        finally:
+            # the manifest is fetched outside of any invocation so doesn't hold body buffers past this
+            self._objectStore.releaseBuffers()
+
+        with self._lock:
+            self._entries = entries
+            self._loaded = time.monotonic()
+            self._refreshes += 1
+        logging.info("Bucket manifest has {} objects ({:.0f}ms)".format(len(entries), (time.perf_counter() - started) * 1000))
+        return True
+
+    def _run(self):
+        self.refresh()
+        while self._refreshInterval > 0 and not self._stop.wait(self._refreshInterval):
+            self.refresh()
+
+    def start(self):
+        """Loads the index on a background thread, which then keeps it refreshed."""
+        if None == self._thread:
+            self._thread = threading.Thread(target=self._run, name="bucket-manifest", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def isLoaded(self):
+        return None != self._entries
+
+    def getSource(self):
+        return self._source
+
+    def covers(self, objectname):
+        """Whether the index can be trusted to say if objectname exists. It never vouches for the manifest object itself."""
+        return None != self._entries and objectname != self._source
+
+    def contains(self, objectname):
+        return objectname in self._entries
+
+    def hasIndex(self, objectname):
+        """True if objectname/index.html exists, i.e. objectname should be redirected to objectname/."""
+        return (objectname + "/index.html") in self._entries
+
+    def get(self, objectname):
+        """The object's metadata as a body-less StoredObject, or None if it isn't in the bucket."""
+        entry = self._entries.get(objectname)
+        if None == entry:
+            return None
+        size, etag, contentType, lastModified = entry
+        headers = {"Content-Type": contentType}
+        if None != size:
+            headers["Content-Length"] = str(size)
+        if etag:
+            headers["ETag"] = etag
+        if lastModified:
+            headers["Last-Modified"] = lastModified
+        return StoredObject(objectname, None, headers)
+
+    def getStats(self):
+        with self._lock:
+            return {
+                "objects": len(self._entries) if None != self._entries else None,
+                "age": round(time.monotonic() - self._loaded) if self._loaded else None,
+                "refreshes": self._refreshes,
+                "failures": self._failures,
+            }
@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+
+from urllib.parse import urljoin
+
+import HTTPClient
+
+
+class OpenIDProvider:
+    """
+    What we need to know about the OpenID Connect provider (IDCS): its endpoints, from the discovery
+    document, and its signing keys, from the JWKS, so that ID tokens can be verified locally.
+
+    Both documents are fetched on first use and kept in process for a TTL. An ID token signed with a
+    key we don't know (kid miss) forces the JWKS to be refreshed, but at most once every
+    MIN_REFRESH_INTERVAL seconds so a bad token can't make us hammer the provider.
+
+    Refreshes are single-flight: when a burst of callbacks all find the cache stale only the first
+    one fetches, the rest wait for it and use its result.
+
+    NOTE: IDCS only serves the JWKS to unauthenticated callers if "Access Signing Certificate" is
+    enabled in the tenant's default settings.
+    """
+    DISCOVERY_PATH = "/.well-known/openid-configuration"
+    # used when discovery is unavailable. These are the IDCS defaults
+    DEFAULT_AUTHORIZATION_PATH = "/oauth2/v1/authorize"
+    DEFAULT_TOKEN_PATH = "/oauth2/v1/token"
+    DEFAULT_JWKS_PATH = "/admin/v1/SigningCert/jwk"
+
+    MIN_REFRESH_INTERVAL = 60
+    # allowance for clock skew between us and the provider when checking exp / iat
+    LEEWAY = 60
+
+    _baseURL = None
+    _clientID = None
+    _ttl = 3600
+
+    def __init__(self, baseURL, clientID, ttl=3600):
+        self._baseURL = baseURL
+        self._clientID = clientID
+        self._ttl = ttl
+
+        self._discovery = None
+        self._discoveryFetched = 0
+        self._discoveryLock = threading.Lock()
+
+        self._keys = {}
+        self._keysFetched = 0
+        self._keysLock = threading.Lock()
+
+    def _get(self, url):
+        r = HTTPClient.getClient().get(url)
+        r.raise_for_status()
+        return r.json()
+
+    def getDiscovery(self):
+        """The discovery document, or an empty dict if it couldn't be fetched."""
+        if self._discoveryFetched and time.monotonic() - self._discoveryFetched < self._ttl:
+            return self._discovery
+
+        decided = self._discoveryFetched
+        with self._discoveryLock:
+            if self._discoveryFetched != decided:
+                # somebody else refreshed it while we waited
+                return self._discovery
+
+            url = urljoin(self._baseURL, self.DISCOVERY_PATH)
+            logging.debug("Fetching OpenID discovery document from {}".format(url))
+            try:
+                self._discovery = self._get(url)
+            except (Exception) as e:
+                logging.error("Failed to get OpenID discovery document: {}".format(e))
+                # keep whatever we had. Try again after the minimum interval rather than on every request
+                self._discovery = self._discovery or {}
+                self._discoveryFetched = time.monotonic() - self._ttl + self.MIN_REFRESH_INTERVAL
+                return self._discovery
+
+            self._discoveryFetched = time.monotonic()
+            return self._discovery
+
+    def getAuthorizationEndpoint(self):
+        return self.getDiscovery().get("authorization_endpoint") or urljoin(self._baseURL, self.DEFAULT_AUTHORIZATION_PATH)
+
+    def getTokenEndpoint(self):
+        return self.getDiscovery().get("token_endpoint") or urljoin(self._baseURL, self.DEFAULT_TOKEN_PATH)
+
+    def getJWKSURI(self):
+        return self.getDiscovery().get("jwks_uri") or urljoin(self._baseURL, self.DEFAULT_JWKS_PATH)
+
+    def getLogoutEndpoint(self):
+        """Where to send the browser to sign out of the provider, if it says."""
+        return self.getDiscovery().get("end_session_endpoint")
+
+    def getIssuer(self):
+        return self.getDiscovery().get("issuer")
+
+    def _refreshKeys(self, decided):
+        import jwt
+
+        with self._keysLock:
+            if self._keysFetched != decided:
+                return
+            if decided and time.monotonic() - decided < self.MIN_REFRESH_INTERVAL:
+                logging.debug("JWKS refreshed too recently to refresh again")
+                return
+
+            url = self.getJWKSURI()
+            logging.debug("Fetching JWKS from {}".format(url))
+            try:
+                jwks = self._get(url)
+            except (Exception) as e:
+                logging.error("Failed to get JWKS: {}".format(e))
+                return
+
+            keys = {}
+            for jwk in jwks.get("keys", []):
+                try:
+                    keys[jwk.get("kid")] = jwt.PyJWK(jwk)
+                except (Exception) as e:
+                    logging.debug("Skipping unusable JWK {}: {}".format(jwk.get("kid"), e))
+            logging.debug("JWKS has {} usable keys".format(len(keys)))
+            self._keys = keys
+            self._keysFetched = time.monotonic()
+
+    def getSigningKey(self, kid):
+        fetched = self._keysFetched
+        if not fetched or time.monotonic() - fetched >= self._ttl:
+            self._refreshKeys(fetched)
+
+        key = self._keys.get(kid)
+        if None == key:
+            # the provider may have rolled its keys
+            logging.debug("Key {} not in JWKS, refreshing".format(kid))
+            self._refreshKeys(self._keysFetched)
+            key = self._keys.get(kid)
+        return key
+
+    def verifyIDToken(self, idtoken):
+        """
+        Checks an ID token's signature, audience, issuer and lifetime and returns its claims.
+        Raises a jwt.InvalidTokenError (or subclass) if the token is no good.
+        """
+        import jwt
+
+        header = jwt.get_unverified_header(idtoken)
+        key = self.getSigningKey(header.get("kid"))
+        if None == key:
+            raise jwt.InvalidTokenError("No signing key found for kid {}".format(header.get("kid")))
+
+        options = {"require": ["exp", "iat", "sub"]}
+        issuer = self.getIssuer()
+        if None == issuer:
+            options["verify_iss"] = False
+
+        return jwt.decode(idtoken, key.key,
+                          algorithms=[key.algorithm_name],
+                          audience=self._clientID,
+                          issuer=issuer,
+                          leeway=self.LEEWAY,
+                          options=options)
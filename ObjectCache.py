@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class ObjectCache:
+    """
+    A bounded, byte-size aware LRU cache for objects fetched from Object Storage.
+
+    Entries are anything with a size() method and a "fetched" timestamp (see ObjectStore.StoredObject).
+    The cache lives in the function container so it survives between warm invocations.
+    """
+    # rough allowance for the headers, key and bookkeeping of each entry
+    ENTRY_OVERHEAD = 512
+
+    _maxBytes = 0
+    _maxEntryBytes = 0
+    _ttl = 0
+
+    def __init__(self, maxBytes, maxEntryBytes, ttl):
+        logging.debug("Initializing object cache: {} bytes max, {} bytes per entry, {}s TTL".format(maxBytes, maxEntryBytes, ttl))
+        self._maxBytes = maxBytes
+        self._maxEntryBytes = min(maxEntryBytes, maxBytes)
+        self._ttl = ttl
+
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "revalidated": 0,
+            "evictions": 0,
+            "rejected": 0,
+        }
+
+    def _entrySize(self, entry):
+        return entry.size() + self.ENTRY_OVERHEAD
+
+    def getTTL(self):
+        return self._ttl
+
+    def isFresh(self, entry):
+        return (time.monotonic() - entry.fetched) < self._ttl
+
+    def get(self, key):
+        """
+        Returns the cached entry for key (fresh or stale) or None.
+        Callers use isFresh() to decide whether the entry needs revalidating.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if self.isFresh(entry):
+                self._stats["hits"] += 1
+            else:
+                self._stats["stale"] += 1
+            return entry
+
+    def put(self, key, entry):
+        """
+        Adds (or replaces) an entry, evicting least recently used entries to stay under the byte limit.
+        Returns False if the entry is too large to be cached.
+        """
+        size = self._entrySize(entry)
+        with self._lock:
+            self._remove(key)
+
+            if size > self._maxEntryBytes:
+                self._stats["rejected"] += 1
+                return False
+
+            while self._entries and self._bytes + size > self._maxBytes:
+                evictedKey, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(evictedKey)
+                self._stats["evictions"] += 1
+
+            self._entries[key] = entry
+            self._sizes[key] = size
+            self._bytes += size
+            return True
+
+    def revalidated(self, key):
+        """Marks an entry as fresh again after the origin confirmed it has not changed."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.fetched = time.monotonic()
+                self._stats["revalidated"] += 1
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        if key in self._entries:
+            del self._entries[key]
+            self._bytes -= self._sizes.pop(key)
+
+    def getStats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["maxBytes"] = self._maxBytes
+            return stats
@@ -1,8 +1,200 @@
+import contextvars
 import logging
+import threading
+import time
 
 import oci
 import os
 
+from requests.structures import CaseInsensitiveDict
+
+import Timing
+
+from Resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, describe, isRetryable
+from SingleFlight import SingleFlight
+
+# the resource principal signer can be fetched in the background while the function starts up
+_prewarmThread = None
+_prewarmedSigner = None
+_prewarmError = None
+
+# one signer, and one client per region, for every ObjectStore in the container
+_signer = None
+_clients = {}
+_clientsLock = threading.Lock()
+# (connect, read) timeout for every Object Storage call, in seconds
+_timeout = (3, 10)
+
+
+def _fetchSigner():
+    global _prewarmedSigner
+    global _prewarmError
+    try:
+        _prewarmedSigner = oci.auth.signers.get_resource_principals_signer()
+    except (Exception) as e:
+        _prewarmError = e
+
+
+def prewarmSigner():
+    """
+    Starts getting the Resource Principal signer on a background thread so that the
+    first invocation doesn't have to wait for it.
+    """
+    global _prewarmThread
+    if None == _prewarmThread:
+        logging.debug("Pre-warming Resource Principal Signer")
+        _prewarmThread = threading.Thread(target=_fetchSigner, name="signer-prewarm", daemon=True)
+        _prewarmThread.start()
+
+
+def getSigner():
+    """
+    Returns the container's Resource Principal signer: the pre-warmed one if there is one, otherwise
+    one got now. Either way it's kept, and refreshes its own token, so every later caller shares it.
+    """
+    global _prewarmThread
+    global _signer
+    with _clientsLock:
+        if None != _signer:
+            return _signer
+        if None != _prewarmThread:
+            _prewarmThread.join()
+            _prewarmThread = None
+            _signer = _prewarmedSigner
+            if None == _signer:
+                logging.warning("Pre-warming signer failed ({}), trying again".format(_prewarmError))
+        if None == _signer:
+            _signer = oci.auth.signers.get_resource_principals_signer()
+        return _signer
+
+
+def setTimeouts(connectTimeout, readTimeout):
+    """Sets the timeouts for the clients created from now on. Call before the first getRegionClient."""
+    global _timeout
+    _timeout = (connectTimeout, readTimeout)
+
+
+def getRegionClient(region):
+    """
+    The Object Storage client for a region (None meaning the function's own), created on first use.
+    Buckets in the same region share it, and with it its connection pool.
+    Returns the region and the client.
+    """
+    signer = getSigner()
+    if None == region:
+        region = signer.region
+    with _clientsLock:
+        client = _clients.get(region)
+        if None == client:
+            logging.info("Creating Object Storage client for region {}".format(region))
+            # the SDK's own retries can go on for minutes, and its circuit breaker raises an error nothing
+            # here knows to serve stale for. ObjectStore does both itself
+            client = oci.object_storage.ObjectStorageClient({"region": region}, signer=signer, timeout=_timeout,
+                                                            retry_strategy=oci.retry.NoneRetryStrategy(),
+                                                            circuit_breaker_strategy=oci.circuit_breaker.NoCircuitBreakerStrategy())
+            _clients[region] = client
+        return region, client
+
+
+class ObjectTooLargeError(Exception):
+    """Raised instead of reading a body bigger than the whole buffer budget."""
+
+    def __init__(self, size, maxBytes):
+        super().__init__("Body of {} bytes is bigger than the {} byte buffer budget".format(size, maxBytes))
+        self.size = size
+        self.maxBytes = maxBytes
+
+
+class BufferBudget:
+    """
+    Limits how many bytes of object bodies can be held in memory at once across all the
+    invocations running in this container.
+
+    Bytes are claimed before a body is read and handed back by release() once the invocation
+    that read them is done (see func.handler). An invocation only ever waits for bytes other
+    invocations hold - never its own, which it can't give back until it's done. A single body
+    bigger than the whole budget doesn't fit at all (see fits) and is never read.
+
+    What an invocation holds is kept in a context variable. Call track() before offloading
+    reads to other threads so that they all count against the caller.
+    """
+    def __init__(self, maxBytes):
+        self._maxBytes = maxBytes
+        self._inUse = 0
+        self._condition = threading.Condition()
+        self._held = contextvars.ContextVar("bufferBudgetHeld")
+
+    def track(self):
+        """Makes sure the current context has somewhere to record what it holds, and returns it."""
+        held = self._held.get(None)
+        if None == held:
+            held = [0]
+            self._held.set(held)
+        return held
+
+    def fits(self, size):
+        return size <= self._maxBytes
+
+    def acquire(self, size):
+        held = self.track()
+        with self._condition:
+            while self._inUse > held[0] and self._inUse + size > self._maxBytes:
+                self._condition.wait()
+            self._inUse += size
+            held[0] += size
+
+    def release(self, size=None):
+        """Gives back size bytes the current context acquired, or everything it acquired."""
+        held = self._held.get(None)
+        if None == held:
+            return
+        with self._condition:
+            size = held[0] if None == size else min(size, held[0])
+            if size:
+                self._inUse -= size
+                held[0] -= size
+                self._condition.notify_all()
+
+    def getInUse(self):
+        return self._inUse
+
+    def getMaxBytes(self):
+        return self._maxBytes
+
+
+class StoredObject:
+    """
+    An object body plus the response headers Object Storage returned with it.
+
+    This is what getObject hands back, whether it came from the network or from the cache.
+    headObject hands back the same thing with no content.
+    """
+    def __init__(self, name, content, headers):
+        self.name = name
+        self.content = content
+        self.headers = CaseInsensitiveDict(headers)
+        self.fetched = time.monotonic()
+
+    def getETag(self):
+        return self.headers.get("ETag")
+
+    def getContentType(self):
+        return self.headers.get("Content-Type")
+
+    def getTotalLength(self):
+        """Length of the whole object, even if we only hold part (or none) of it."""
+        contentRange = self.headers.get("Content-Range")
+        if contentRange:
+            return int(contentRange.rsplit("/", 1)[1])
+        if None != self.content:
+            return len(self.content)
+        return int(self.headers.get("Content-Length"))
+
+    def size(self):
+        if None == self.content:
+            return 0
+        return len(self.content)
+
 
 class ObjectStore:
     _region = ""
@@ -10,38 +202,377 @@ class ObjectStore:
     _bucket_name = None
     _object_storage_client = None
     _namespace = None
+    _cache = None
+    _budget = None
+    _chunkSize = 1024 * 1024
+    _manifest = None
+
+    def __init__(self, region, bucketname, cache=None, namespace=None, budget=None, chunkSize=1024 * 1024, client=None,
+                 retry=None, breaker=None, staleIfError=None):
+        """
+        client replaces the real Object Storage client, e.g. with a LocalObjectStorageClient for tests
+        and benchmarks. With one there's no Resource Principal signer involved at all.
 
-    def __init__(self, region, bucketname):
+        Transient failures are retried by retry (a RetryPolicy) and counted by breaker (a CircuitBreaker).
+        When they still fail, a cached copy up to staleIfError seconds past its TTL is served instead
+        (None meaning any age, 0 never).
+        """
         logging.debug("Initializing object store layer.")
         self._region = region
         self._bucket_name = bucketname
-
-        #TODO: come up with some way to tell this class that we're running a test
+        self._cache = cache
+        self._namespace = namespace
+        self._budget = budget
+        self._chunkSize = chunkSize
+        # concurrent fetches of the same object share one call to Object Storage
+        self._flights = SingleFlight()
+        self._retry = retry or RetryPolicy()
+        self._breaker = breaker or CircuitBreaker("Object Storage bucket {}".format(bucketname))
+        self._staleIfError = staleIfError
 
         try:
-            logging.debug("Instantiating Resource Principal Signer")
-            # we are going to use the Resource Principal signer to sign out requests to Object Store:
-            self._signer = oci.auth.signers.get_resource_principals_signer()
-
-            if None == region:
-                self._region = self._signer.region
-
-            logging.getLogger().info('Getting object store handle')
-            self._object_storage_client = oci.object_storage.ObjectStorageClient({ "region": self._region}, signer=self._signer)
-            self._namespace = self._object_storage_client.get_namespace().data
+            if None != client:
+                logging.info("Using supplied object storage client {}".format(type(client).__name__))
+                self._object_storage_client = client
+            else:
+                # we are going to use the Resource Principal signer to sign out requests to Object Store:
+                logging.debug("Getting object store handle")
+                self._region, self._object_storage_client = getRegionClient(region)
+                self._signer = getSigner()
+            # looking up the namespace is a round trip we can skip if we were told what it is
+            if None == self._namespace:
+                self._namespace = self._call(self._object_storage_client.get_namespace).data
 
         except (Exception) as e:
             logging.getLogger().critical('Exception: ' + str(e))
             logging.critical(e, exc_info=True)
             raise e
 
+    def getRegion(self):
+        return self._region
+
+    def getBucketName(self):
+        return self._bucket_name
+
+    def getNamespace(self):
+        return self._namespace
+
+    def cacheKey(self, objectname):
+        """
+        Cache entries are keyed by bucket too, as the cache may be shared by the stores for several buckets.
+        And by region, as a bucket name is only unique within its region.
+        """
+        return (self._region, self._namespace, self._bucket_name, objectname)
+
+    def setManifest(self, manifest):
+        """
+        Gives the store a BucketManifest. Once it has loaded, objects it doesn't list are reported
+        missing without asking Object Storage, and metadata comes from it where possible.
+        """
+        self._manifest = manifest
+
+    def _fromManifest(self, objectname):
+        """
+        The object's metadata according to the manifest, or None if there's no loaded manifest to ask.
+        Raises the same 404 ServiceError Object Storage would if the manifest says there's no such object.
+        """
+        if None == self._manifest or not self._manifest.covers(objectname):
+            return None
+        meta = self._manifest.get(objectname)
+        if None == meta:
+            logging.debug("%s is not in the bucket manifest", objectname)
+            Timing.current().note("manifest", "miss")
+            raise oci.exceptions.ServiceError(404, "ObjectNotFound", {}, "{} is not in the bucket manifest".format(objectname))
+        return meta
 
-    def getObject(self, objectname):
+    def isDirectory(self, objectname):
+        """True if the manifest says objectname doesn't exist but objectname/index.html does."""
+        if None == self._manifest or not self._manifest.covers(objectname):
+            return False
+        return not self._manifest.contains(objectname) and self._manifest.hasIndex(objectname)
 
-        obj = self._object_storage_client.get_object(self._namespace, self._bucket_name, objectname)
+    def listObjects(self, prefix=None):
+        """Yields a summary (name, size, etag, time_modified) of every object in the bucket, a page at a time."""
+        kwargs = {"fields": "name,size,etag,timeModified"}
+        if prefix:
+            kwargs["prefix"] = prefix
+        while True:
+            page = self._call(self._object_storage_client.list_objects, self._namespace, self._bucket_name, **kwargs).data
+            for summary in page.objects:
+                yield summary
+            if not page.next_start_with:
+                return
+            kwargs["start"] = page.next_start_with
 
-        logging.getLogger().info("Checking content type")
-        logging.getLogger().info("Content type of object is " + obj.headers['Content-type'])
+    def _call(self, fn, *args, **kwargs):
+        """
+        Makes a call to Object Storage (fn being all of it, body included) through the circuit breaker,
+        retrying transient failures. Only those count as failures - a 404 or 304 is Object Storage working.
+        """
+        attempts = [0]
 
+        def attempt():
+            self._breaker.before()
+            attempts[0] += 1
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if isRetryable(e):
+                    self._breaker.failed()
+                else:
+                    self._breaker.succeeded()
+                raise
+            self._breaker.succeeded()
+            return result
+
+        try:
+            return self._retry.call(attempt)
+        finally:
+            if attempts[0] > 1:
+                Timing.current().note("retries", attempts[0] - 1)
+
+    def _staleOnError(self, cached, e):
+        """Whether to answer with the stale cached copy because Object Storage failed (or isn't being asked)."""
+        if None == cached or not (isinstance(e, CircuitOpenError) or isRetryable(e)):
+            return False
+        if None != self._staleIfError and time.monotonic() - cached.fetched > self._cache.getTTL() + self._staleIfError:
+            return False
+        logging.warning("Serving stale copy of %s: %s", cached.name, describe(e))
+        Timing.current().note("cache", "stale-error")
+        return True
+
+    def _upstream(self, operation, objectname, **kwargs):
+        """Calls an Object Storage operation on objectname, counting the time against the current request."""
+        started = time.perf_counter()
+        try:
+            return self._call(operation, self._namespace, self._bucket_name, objectname, **kwargs)
+        finally:
+            Timing.current().upstream(time.perf_counter() - started)
+
+    def _iterBody(self, obj):
+        """
+        Yields the body of a get_object response in chunks, as it arrives.
+        The bytes are passed through exactly as stored, even if the object has a Content-Encoding.
+        """
+        return obj.data.raw.stream(self._chunkSize, decode_content=False)
+
+    def _readBody(self, obj):
+        """
+        Reads a get_object response body chunk by chunk into a single buffer allocated up front,
+        so peak memory is the object plus one chunk (rather than the chunks plus a joined copy).
+        """
+        length = int(obj.headers["Content-Length"])
+        if None != self._budget:
+            if not self._budget.fits(length):
+                # don't leave the rest of the body sitting on the connection
+                obj.data.raw.close()
+                raise ObjectTooLargeError(length, self._budget.getMaxBytes())
+            self._budget.acquire(length)
+
+        try:
+            body = bytearray(length)
+            view = memoryview(body)
+            received = 0
+            for chunk in self._iterBody(obj):
+                view[received:received + len(chunk)] = chunk
+                received += len(chunk)
+            view.release()
+
+            if received != length:
+                raise IOError("Expected {} bytes but got {}".format(length, received))
+        except Exception:
+            # the body is thrown away (and maybe fetched again) so the bytes claimed for it go back now
+            if None != self._budget:
+                self._budget.release(length)
+            raise
+        return body
+
+    def _getAndRead(self, objectname, **kwargs):
+        obj = self._object_storage_client.get_object(self._namespace, self._bucket_name, objectname, **kwargs)
+
+        logging.debug("Content type of object is %s", obj.headers.get('Content-type'))
+
+        return StoredObject(objectname, self._readBody(obj), obj.headers)
+
+    def _fetchObject(self, objectname, **kwargs):
+        started = time.perf_counter()
+        try:
+            # a body cut off part way is retried along with everything else
+            return self._call(self._getAndRead, objectname, **kwargs)
+        finally:
+            Timing.current().upstream(time.perf_counter() - started)
+
+    def releaseBuffers(self):
+        """Called when an invocation is finished with the bodies it fetched."""
+        if None != self._budget:
+            self._budget.release()
+
+    def _flightKey(self, objectname, what=None):
+        return (self._region, self._namespace, self._bucket_name, objectname, what)
+
+    def _coalesced(self, key, fn, *args, **kwargs):
+        """Runs fn through single-flight, noting on the request timer if we rode on someone else's call."""
+        result, shared = self._flights.do(key, fn, *args, **kwargs)
+        if shared:
+            logging.debug("Shared an in-flight fetch of %s", key[3])
+            Timing.current().note("coalesced", True)
+        return result
+
+    def getObject(self, objectname, byteRange=None):
+        """
+        Gets an object, or just the (start, end) inclusive byte range of it if byteRange is given.
+
+        When a lot of requests miss on the same object at once only one of them goes to Object Storage.
+        The rest wait for it and share what it got - or, if there's a stale cached copy, are given that
+        straight away rather than waiting for the revalidation.
+        """
+        listed = self._fromManifest(objectname)
+        if None != byteRange:
+            return self._getObjectRange(objectname, byteRange)
+
+        key = self._flightKey(objectname)
+        if None == self._cache:
+            return self._coalesced(key, self._fetchObject, objectname)
+
+        cached = self._cache.get(self.cacheKey(objectname))
+        if cached and self._cache.isFresh(cached):
+            logging.debug("Serving %s from cache", objectname)
+            Timing.current().note("cache", "hit")
+            return cached
+
+        if cached and self._flights.inFlight(key):
+            # stale while revalidate: somebody is already refreshing it
+            logging.debug("Serving stale copy of %s while it is refreshed", objectname)
+            Timing.current().note("cache", "stale")
+            return cached
+
+        return self._coalesced(key, self._refreshObject, objectname, cached, listed)
+
+    def _refreshObject(self, objectname, cached, listed):
+        """
+        Revalidates a stale cached copy, or fetches the object if we have no usable copy, and caches the result.
+        If Object Storage is failing the stale copy is better than an error page.
+        """
+        try:
+            return self._revalidateOrFetch(objectname, cached, listed)
+        except Exception as e:
+            if not self._staleOnError(cached, e):
+                raise
+            return cached
+
+    def _revalidateOrFetch(self, objectname, cached, listed):
+        if cached and listed and cached.getETag() and cached.getETag() == listed.getETag():
+            # stale entry but the manifest says it hasn't changed, which is as good as asking
+            logging.debug("%s unchanged according to the manifest", objectname)
+            self._cache.revalidated(self.cacheKey(objectname))
+            Timing.current().note("cache", "revalidated")
+            return cached
+
+        if cached and cached.getETag():
+            # stale entry - ask Object Storage whether it changed rather than pulling the body again
+            logging.debug("Revalidating cached copy of %s", objectname)
+            try:
+                obj = self._fetchObject(objectname, if_none_match=cached.getETag())
+            except oci.exceptions.ServiceError as e:
+                if e.status != 304:
+                    raise
+                logging.debug("%s not modified", objectname)
+                self._cache.revalidated(self.cacheKey(objectname))
+                Timing.current().note("cache", "revalidated")
+                return cached
+        else:
+            obj = self._fetchObject(objectname)
+
+        Timing.current().note("cache", "miss")
+        self._cache.put(self.cacheKey(objectname), obj)
         return obj
 
+    def _slice(self, cached, start, end):
+        part = StoredObject(cached.name, cached.content[start:end + 1], cached.headers)
+        part.headers["Content-Range"] = "bytes {}-{}/{}".format(start, end, cached.size())
+        part.headers["Content-Length"] = str(part.size())
+        return part
+
+    def _getObjectRange(self, objectname, byteRange):
+        start, end = byteRange
+
+        # if we happen to hold the whole object already, slice it rather than going back to Object Storage
+        cached = None
+        if None != self._cache:
+            cached = self._cache.get(self.cacheKey(objectname))
+            if cached and self._cache.isFresh(cached):
+                logging.debug("Serving bytes %d-%d of %s from cache", start, end, objectname)
+                return self._slice(cached, start, end)
+
+        # partial objects never go in the cache - only the whole thing does
+        try:
+            return self._coalesced(self._flightKey(objectname, byteRange),
+                                   self._fetchObject, objectname, range="bytes={}-{}".format(start, end))
+        except Exception as e:
+            if not self._staleOnError(cached, e):
+                raise
+            return self._slice(cached, start, end)
+
+    def headObject(self, objectname):
+        """
+        Gets an object's metadata (ETag, Last-Modified, etc.) without transferring the body.
+        A cached copy, or the manifest, answers this without any network call at all.
+        """
+        listed = self._fromManifest(objectname)
+        cached = None
+        if None != self._cache:
+            cached = self._cache.get(self.cacheKey(objectname))
+            if cached and self._cache.isFresh(cached):
+                logging.debug("Serving metadata for %s from cache", objectname)
+                Timing.current().note("cache", "hit")
+                return cached
+
+        # a manifest object may leave sizes out, and HEAD and Range requests need one
+        if listed and None != listed.headers.get("Content-Length"):
+            logging.debug("Serving metadata for %s from the manifest", objectname)
+            Timing.current().note("manifest", "hit")
+            return listed
+
+        try:
+            if cached and cached.getETag():
+                try:
+                    obj = self._upstream(self._object_storage_client.head_object, objectname,
+                                         if_none_match=cached.getETag())
+                except oci.exceptions.ServiceError as e:
+                    if e.status != 304:
+                        raise
+                    self._cache.revalidated(self.cacheKey(objectname))
+                    return cached
+                # it changed. Drop the stale copy so the next GET fetches the new body
+                self._cache.remove(self.cacheKey(objectname))
+                return StoredObject(objectname, None, obj.headers)
+
+            obj = self._coalesced(self._flightKey(objectname, "head"),
+                                  self._upstream, self._object_storage_client.head_object, objectname)
+        except Exception as e:
+            if not self._staleOnError(cached, e):
+                raise
+            return cached
+        return StoredObject(objectname, None, obj.headers)
+
+    def getClient(self):
+        return self._object_storage_client
+
+    def getCacheStats(self):
+        if None == self._cache:
+            return None
+        return self._cache.getStats()
+
+    def getFlightStats(self):
+        return self._flights.getStats()
+
+    def getUpstreamStats(self):
+        """Retries and circuit breaker state for calls to Object Storage."""
+        stats = self._breaker.getStats()
+        stats.update(self._retry.getStats())
+        return stats
+
+    def getManifestStats(self):
+        if None == self._manifest:
+            return None
+        return self._manifest.getStats()
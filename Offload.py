@@ -0,0 +1,47 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+# the FDK runs one event loop per container. Blocking work (Object Storage and IDCS calls)
+# goes to this bounded pool so the loop stays free to take the next invocation.
+_executor = None
+_maxWorkers = 4
+_lock = threading.Lock()
+
+
+def configure(maxWorkers):
+    """Sets the pool size. An existing pool with a different size is replaced once its work is done."""
+    global _executor
+    global _maxWorkers
+    with _lock:
+        if maxWorkers == _maxWorkers and None != _executor:
+            return
+        logging.debug("Offload pool set to {} threads".format(maxWorkers))
+        _maxWorkers = maxWorkers
+        old = _executor
+        _executor = None
+    if None != old:
+        old.shutdown(wait=False)
+
+
+def getExecutor():
+    global _executor
+    if None == _executor:
+        with _lock:
+            if None == _executor:
+                _executor = ThreadPoolExecutor(max_workers=_maxWorkers, thread_name_prefix="offload")
+    return _executor
+
+
+async def run(fn, *args, **kwargs):
+    """
+    Runs a blocking function on the pool and waits for it without blocking the event loop.
+    The caller's context variables (request timer, buffer accounting) go with it.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(getExecutor(), functools.partial(context.run, fn, *args, **kwargs))
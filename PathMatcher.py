@@ -0,0 +1,82 @@
+import fnmatch
+import logging
+import re
+
+GLOB_CHARACTERS = "*?["
+REGEX_PREFIX = "re:"
+
+
+class PathMatcher:
+    """
+    Maps request paths to values (e.g. an access policy or a Cache-Control policy) by rule.
+
+    Rules are one of:
+      * a prefix, e.g. /members/           matches anything starting with it
+      * a glob, e.g. /docs/*.pdf            matches with fnmatch semantics (* crosses / here)
+      * a regex, e.g. re:^/reports/\\d+/     matches with re.match
+
+    Glob and regex rules are checked first, in the order they were added, since they are the more
+    specific statement of intent. Otherwise the longest matching prefix wins.
+
+    Everything is compiled when rules are added so that a lookup is a handful of dict probes
+    (one per distinct prefix length) plus at most one regex match, however many rules there are.
+    """
+
+    def __init__(self):
+        self._prefixes = {}
+        self._lengths = []
+        self._patterns = []
+        self._sources = []
+        self._combined = None
+        self._rules = []
+
+    def add(self, rule, value):
+        rule = rule.strip()
+        self._rules.append(rule)
+        if rule.startswith(REGEX_PREFIX):
+            try:
+                regex = re.compile(rule[len(REGEX_PREFIX):])
+            except re.error as e:
+                logging.error("Path rule {} is not a valid regular expression: {}".format(rule, e))
+                raise RuntimeError("Invalid path rule")
+            self._addPattern(regex.pattern, value)
+            return
+
+        if not rule.startswith("/"):
+            logging.error("Path {} does not begin with / character".format(rule))
+            raise RuntimeError("Invalid path specified")
+
+        if any(c in rule for c in GLOB_CHARACTERS):
+            self._addPattern(fnmatch.translate(rule), value)
+            return
+
+        self._prefixes[rule] = value
+        self._lengths = sorted(set(len(prefix) for prefix in self._prefixes), reverse=True)
+
+    def _addPattern(self, pattern, value):
+        self._patterns.append(value)
+        self._sources.append(pattern)
+        # one alternation with a named group per rule means a single regex match per lookup
+        self._combined = re.compile("|".join(
+            "(?P<_rule{}>{})".format(i, source) for i, source in enumerate(self._sources)))
+
+    def match(self, path, default=None):
+        """Returns the value of the rule that applies to path, or default if none does."""
+        if self._combined:
+            m = self._combined.match(path)
+            if m:
+                for i, value in enumerate(self._patterns):
+                    if None != m.group("_rule{}".format(i)):
+                        return value
+
+        for length in self._lengths:
+            value = self._prefixes.get(path[:length])
+            if None != value:
+                return value
+        return default
+
+    def getRules(self):
+        return list(self._rules)
+
+    def __len__(self):
+        return len(self._prefixes) + len(self._patterns)
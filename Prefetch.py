@@ -0,0 +1,172 @@
+import fnmatch
+import logging
+import threading
+import time
+
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
+
+from PathMatcher import GLOB_CHARACTERS
+
+
+class _AssetParser(HTMLParser):
+    """Collects the URLs a page pulls in with <link href>, <script src> and <img src>."""
+    ATTRIBUTES = {"link": "href", "script": "src", "img": "src"}
+
+    def __init__(self):
+        super().__init__()
+        self.references = []
+
+    def handle_starttag(self, tag, attrs):
+        attribute = self.ATTRIBUTES.get(tag)
+        if None == attribute:
+            return
+        for name, value in attrs:
+            if name == attribute and value:
+                self.references.append(value)
+
+
+def linkedAssets(pagePath, html):
+    """
+    The same-site assets an HTML page references, as object names, in the order they appear.
+    pagePath is the page's URL path, which relative references are resolved against.
+    """
+    parser = _AssetParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except (Exception) as e:
+        logging.debug("Could not parse {} for linked assets: {}".format(pagePath, e))
+
+    assets = []
+    for reference in parser.references:
+        url = urlparse(urljoin(pagePath, reference))
+        # other sites, data: URLs and the like aren't ours to fetch
+        if url.scheme or url.netloc or not url.path.startswith("/"):
+            continue
+        path = url.path
+        if path.endswith("/"):
+            path += "index.html"
+        name = path[1:]
+        if name and not name in assets:
+            assets.append(name)
+    return assets
+
+
+class Prefetcher:
+    """
+    Loads chosen objects into the object cache on a background thread when a container starts, so the
+    first visitors it serves don't each pay the full Object Storage latency for the homepage and its assets.
+
+    Paths are the same shape as request URLs:
+      * /about.html        that object
+      * /docs/             the directory's index.html
+      * /assets/*          every object matching the glob (listed from the bucket)
+
+    At most maxBytes of bodies are fetched. An object is skipped, before its body is fetched, if it
+    would take the total over that or if it is bigger than maxEntryBytes (the largest the cache will
+    keep). Sizes come from the bucket listing for globs, and from a HEAD for everything else.
+
+    With followLinks the HTML pages fetched are also scanned for same-site <link>, <script> and <img>
+    references, which are fetched too - one level deep, and within the same byte budget.
+    """
+    _objectStore = None
+    _paths = []
+    _maxBytes = 0
+    _maxEntryBytes = None
+    _followLinks = False
+
+    def __init__(self, objectStore, paths, maxBytes, followLinks=False, maxEntryBytes=None):
+        self._objectStore = objectStore
+        self._paths = paths
+        self._maxBytes = maxBytes
+        self._maxEntryBytes = maxEntryBytes
+        self._followLinks = followLinks
+
+        self._thread = None
+        self._stats = {"objects": 0, "bytes": 0, "failures": 0, "skipped": 0, "ms": None}
+
+    def _expand(self, path):
+        """(object name, size) for each object one configured path covers. The size is None if it isn't known yet."""
+        if path.endswith("/"):
+            return [(path[1:] + "index.html", None)]
+        if not any(c in path for c in GLOB_CHARACTERS):
+            return [(path[1:], None)]
+
+        pattern = path[1:]
+        prefix = pattern
+        for c in GLOB_CHARACTERS:
+            prefix = prefix.split(c, 1)[0]
+        return [(summary.name, summary.size) for summary in self._objectStore.listObjects(prefix)
+                if fnmatch.fnmatchcase(summary.name, pattern)]
+
+    def _fits(self, objectname, size):
+        if self._stats["bytes"] + size > self._maxBytes:
+            logging.debug("Not prefetching {}, {} bytes would go over the prefetch budget".format(objectname, size))
+            return False
+        if None != self._maxEntryBytes and size > self._maxEntryBytes:
+            logging.debug("Not prefetching {}, {} bytes is too big to cache".format(objectname, size))
+            return False
+        return True
+
+    def _fetch(self, objectname, size=None):
+        """Fetches one object into the cache. Returns it, or None if it couldn't be (or shouldn't be) fetched."""
+        try:
+            if None == size:
+                size = self._objectStore.headObject(objectname).getTotalLength()
+            if not self._fits(objectname, size):
+                self._stats["skipped"] += 1
+                return None
+            obj = self._objectStore.getObject(objectname)
+        except (Exception) as e:
+            logging.info("Could not prefetch {}: {}".format(objectname, e))
+            self._stats["failures"] += 1
+            return None
+        finally:
+            # prefetching happens outside of any invocation so must give its buffers back itself
+            self._objectStore.releaseBuffers()
+
+        self._stats["objects"] += 1
+        self._stats["bytes"] += obj.size()
+        return obj
+
+    def run(self):
+        started = time.perf_counter()
+        fetched = set()
+        pages = []
+
+        for path in self._paths:
+            try:
+                names = self._expand(path)
+            except (Exception) as e:
+                logging.info("Could not list objects for prefetch path {}: {}".format(path, e))
+                self._stats["failures"] += 1
+                continue
+            for name, size in names:
+                if name in fetched:
+                    continue
+                fetched.add(name)
+                obj = self._fetch(name, size)
+                if obj and self._followLinks and (obj.getContentType() or "").startswith("text/html"):
+                    pages.append(obj)
+
+        for page in pages:
+            for name in linkedAssets("/" + page.name, bytes(page.content).decode("utf-8", "replace")):
+                if not name in fetched:
+                    fetched.add(name)
+                    self._fetch(name)
+
+        self._stats["ms"] = round((time.perf_counter() - started) * 1000)
+        logging.info("Prefetched {} objects ({} bytes) in {}ms".format(self._stats["objects"], self._stats["bytes"], self._stats["ms"]))
+
+    def start(self):
+        if None == self._thread:
+            self._thread = threading.Thread(target=self.run, name="prefetch", daemon=True)
+            self._thread.start()
+
+    def join(self, timeout=None):
+        if None != self._thread:
+            self._thread.join(timeout)
+
+    def getStats(self):
+        return dict(self._stats)
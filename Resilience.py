@@ -0,0 +1,172 @@
+import logging
+import math
+import random
+import threading
+import time
+
+import oci
+
+from urllib3.exceptions import HTTPError as TransportError
+
+# statuses worth another try: throttling and failures on Object Storage's side
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that has been failing. retryAfter is seconds until it is tried again."""
+
+    def __init__(self, name, retryAfter):
+        super().__init__("{} is unavailable, will try again in {:.1f}s".format(name, retryAfter))
+        self.retryAfter = retryAfter
+
+
+def isRetryable(e):
+    """
+    Whether an exception from an upstream call is a transient failure: throttling, a 5xx, a timeout or
+    a dropped connection (including one dropped while the body was being read).
+    """
+    if isinstance(e, oci.exceptions.ServiceError):
+        return e.status in RETRY_STATUSES
+    return isinstance(e, (OSError, TransportError))
+
+
+def describe(e):
+    """A one line description of a failure for the log. A ServiceError's own is a page long."""
+    if isinstance(e, oci.exceptions.ServiceError):
+        return "{} {}".format(e.status, e.code)
+    return "{}: {}".format(type(e).__name__, e)
+
+
+def retryAfter(e):
+    """How long, in seconds, the failure says to wait before trying again, or None if it doesn't say."""
+    if isinstance(e, CircuitOpenError):
+        return e.retryAfter
+    headers = getattr(e, "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0, int(headers.get("Retry-After") or headers.get("retry-after")))
+    except (TypeError, ValueError):
+        # it may be an HTTP date. Not worth parsing - treat it as unspecified
+        return None
+
+
+def retryAfterHeader(e, default=1):
+    """A Retry-After header value (whole seconds, at least 1) to send to the browser for failure e."""
+    return str(max(1, int(math.ceil(retryAfter(e) or default))))
+
+
+class RetryPolicy:
+    """
+    Retries transient failures (see isRetryable) up to `retries` more times, with exponential backoff
+    and full jitter so that invocations which failed together don't all come back together.
+
+    Each wait is capped at maxBackoff seconds. If the upstream asks for a longer wait (Retry-After)
+    the failure is passed straight on instead, since nobody is going to wait that long for a page.
+    """
+
+    def __init__(self, retries=2, backoff=0.1, maxBackoff=1.0):
+        self._retries = retries
+        self._backoff = backoff
+        self._maxBackoff = maxBackoff
+        self._stats = {"retries": 0, "gaveUp": 0}
+
+    def delay(self, attempt, e):
+        """Seconds to wait before retrying after the attempt'th failure (from 0), or None to give up."""
+        wait = random.uniform(0, min(self._maxBackoff, self._backoff * (2 ** attempt)))
+        hinted = retryAfter(e)
+        if None != hinted:
+            if hinted > self._maxBackoff:
+                return None
+            wait = max(wait, hinted)
+        return wait
+
+    def call(self, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not isRetryable(e):
+                    raise
+                wait = self.delay(attempt, e) if attempt < self._retries else None
+                if None == wait:
+                    self._stats["gaveUp"] += 1
+                    raise
+                logging.warning("Upstream call failed (%s), retry %d in %.0fms", describe(e), attempt + 1, wait * 1000)
+                self._stats["retries"] += 1
+                attempt += 1
+                time.sleep(wait)
+
+    def getStats(self):
+        return dict(self._stats)
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream that keeps failing, so invocations fail (or are served from cache) at
+    once instead of each waiting out its own timeouts and retries.
+
+    After `failures` transient failures in a row the circuit opens: before() raises CircuitOpenError
+    for the next resetAfter seconds. Then a single trial call is let through. If it works the circuit
+    closes again, if not it stays open for another resetAfter. failures of 0 means never open.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name, failures=5, resetAfter=30):
+        self._name = name
+        self._failures = failures
+        self._resetAfter = resetAfter
+
+        self._state = self.CLOSED
+        self._failed = 0
+        self._openedAt = 0
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "rejected": 0}
+
+    def before(self):
+        """Call before each upstream call. Raises CircuitOpenError if it shouldn't be made."""
+        if self.CLOSED == self._state:
+            return
+        with self._lock:
+            if self.CLOSED == self._state:
+                return
+            waited = time.monotonic() - self._openedAt
+            if self.OPEN == self._state and waited >= self._resetAfter:
+                logging.info("Trying %s again", self._name)
+                self._state = self.HALF_OPEN
+                return
+            # open, or half open with the trial call still out
+            self._stats["rejected"] += 1
+            raise CircuitOpenError(self._name, max(0, self._resetAfter - waited))
+
+    def succeeded(self):
+        if self.CLOSED == self._state and 0 == self._failed:
+            return
+        with self._lock:
+            if self.CLOSED != self._state:
+                logging.warning("%s is back, closing circuit", self._name)
+            self._state = self.CLOSED
+            self._failed = 0
+
+    def failed(self):
+        with self._lock:
+            self._failed += 1
+            if self.HALF_OPEN == self._state or (self._failures and self.CLOSED == self._state and self._failed >= self._failures):
+                if self.CLOSED == self._state:
+                    logging.error("%s failed %d times in a row, opening circuit for %ds", self._name, self._failed, self._resetAfter)
+                    self._stats["opened"] += 1
+                self._state = self.OPEN
+                self._openedAt = time.monotonic()
+
+    def getState(self):
+        return self._state
+
+    def getStats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["state"] = self._state
+            stats["failures"] = self._failed
+            return stats
@@ -0,0 +1,94 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class SessionManager:
+    """
+    Stateless sessions in an HMAC signed cookie.
+
+    The cookie value is base64url(JSON claims) + "." + base64url(HMAC-SHA256 of the first part).
+    The claims always include the subject ("sub") and an expiry ("exp", epoch seconds), so a
+    protected request can be checked locally without any call to the identity provider.
+
+    Sessions slide: once less than half of the lifetime is left a fresh cookie is issued.
+    """
+    COOKIE_NAME = "session"
+
+    _key = None
+    _ttl = 3600
+    _secure = True
+
+    def __init__(self, key, ttl=3600, secure=True):
+        if None == key:
+            # sessions will only be good within this one container, which is better than nothing
+            logging.warning("No session key configured. Generating a random one.")
+            key = os.urandom(32)
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        self._key = key
+        self._ttl = ttl
+        self._secure = secure
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._key, payload.encode("utf-8"), hashlib.sha256).digest())
+
+    def issue(self, subject, claims=None):
+        """Returns a signed cookie value for subject, carrying any extra claims given."""
+        session = dict(claims or {})
+        session["sub"] = subject
+        session["exp"] = int(time.time()) + self._ttl
+        payload = _b64encode(json.dumps(session, separators=(",", ":")).encode("utf-8"))
+        return payload + "." + self._sign(payload)
+
+    def verify(self, value):
+        """Returns the claims from a cookie value if the signature is good and it hasn't expired, otherwise None."""
+        if not value or not "." in value:
+            return None
+
+        payload, signature = value.rsplit(".", 1)
+        if not hmac.compare_digest(signature.encode("utf-8"), self._sign(payload).encode("ascii")):
+            logging.info("Session cookie signature is not valid")
+            return None
+
+        try:
+            session = json.loads(_b64decode(payload))
+        except ValueError:
+            logging.info("Session cookie payload could not be decoded")
+            return None
+
+        if not isinstance(session, dict) or not session.get("sub") or session.get("exp", 0) <= time.time():
+            logging.debug("Session has expired")
+            return None
+        return session
+
+    def needsRenewal(self, session):
+        return session["exp"] - time.time() < self._ttl / 2
+
+    def renew(self, session):
+        claims = {k: v for k, v in session.items() if k not in ("sub", "exp")}
+        return self.issue(session["sub"], claims)
+
+    def cookieHeader(self, value, maxAge=None):
+        """A Set-Cookie header value for the given session cookie value."""
+        header = "{}={}; Path=/; Max-Age={}; HttpOnly; SameSite=Lax".format(
+            self.COOKIE_NAME, value, self._ttl if None == maxAge else maxAge)
+        if self._secure:
+            header += "; Secure"
+        return header
+
+    def expiredCookieHeader(self):
+        """A Set-Cookie header value that makes the browser drop its session cookie, i.e. logs the user out."""
+        return self.cookieHeader("", 0)
@@ -0,0 +1,62 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one.
+
+    The first caller for a key (the leader) runs the function. Anyone asking for the same key while it
+    is running waits for it and gets the same result, or the same exception, instead of making a call
+    of their own. Once the leader finishes the key is forgotten, so nothing is cached here - that is
+    ObjectCache's job.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "shared": 0}
+
+    def inFlight(self, key):
+        return key in self._calls
+
+    def do(self, key, fn, *args, **kwargs):
+        """Returns (result, shared) where shared is True if the result came from someone else's call."""
+        with self._lock:
+            call = self._calls.get(key)
+            if None != call:
+                self._stats["shared"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["calls"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if None != call.error:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def getStats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["inFlight"] = len(self._calls)
+            return stats
@@ -0,0 +1,110 @@
+import logging
+import threading
+
+from PathMatcher import PathMatcher, GLOB_CHARACTERS, REGEX_PREFIX
+
+ANY_HOST = "*"
+
+
+class Route:
+    """Where requests for one site (a host, optionally under a path prefix) are served from."""
+
+    def __init__(self, host, pathPrefix, region, bucket, objectPrefix=""):
+        self.host = host
+        self.pathPrefix = pathPrefix
+        self.region = region
+        self.bucket = bucket
+        self.objectPrefix = objectPrefix
+
+    def objectName(self, path):
+        """The object a request path maps to, e.g. /blog/a.html under /blog/ => posts/ is posts/a.html."""
+        return self.objectPrefix + path[len(self.pathPrefix):]
+
+    def __repr__(self):
+        return "{}{} => {}:{}/{}".format(self.host, self.pathPrefix, self.region, self.bucket, self.objectPrefix)
+
+
+class SiteRouter:
+    """
+    Picks the Route for a request by its Host header and then the longest matching path prefix.
+    Routes for host * apply to any host that has no routes of its own.
+
+    Routes are given as a ; separated list of host[/path/]=[region:]bucket[/prefix/] entries, e.g.
+        www.example.com=site-www;example.com/docs/=us-ashburn-1:site-docs/v2/;*=site-default
+    """
+
+    def __init__(self):
+        self._hosts = {}
+
+    def add(self, route):
+        matcher = self._hosts.get(route.host)
+        if None == matcher:
+            matcher = PathMatcher()
+            self._hosts[route.host] = matcher
+        matcher.add(route.pathPrefix, route)
+
+    def parse(self, setting):
+        for entry in setting.split(";"):
+            entry = entry.strip()
+            if not entry:
+                continue
+            site, equals, target = entry.partition("=")
+            if not equals or not site.strip() or not target.strip():
+                logging.error('Site route "{}" is not of the form host[/path/]=[region:]bucket[/prefix/]'.format(entry))
+                raise RuntimeError("Invalid Sites setting")
+
+            host, slash, path = site.strip().partition("/")
+            pathPrefix = slash + path if slash else "/"
+            if path.startswith(REGEX_PREFIX) or any(c in path for c in GLOB_CHARACTERS):
+                logging.error('Site route "{}" must use a plain path prefix'.format(entry))
+                raise RuntimeError("Invalid Sites setting")
+
+            region, colon, rest = target.strip().rpartition(":")
+            bucket, slash, objectPrefix = rest.partition("/")
+            if not bucket:
+                logging.error('Site route "{}" has no bucket'.format(entry))
+                raise RuntimeError("Invalid Sites setting")
+            self.add(Route(host.lower(), pathPrefix, region or None, bucket, objectPrefix))
+        return self
+
+    def match(self, host, path):
+        """The Route for a request, or None if no route covers it."""
+        if host:
+            # the port (if any) doesn't pick the site
+            host = host.lower().rsplit(":", 1)[0] if not host.endswith("]") else host.lower()
+        matcher = self._hosts.get(host) or self._hosts.get(ANY_HOST)
+        if None == matcher:
+            return None
+        return matcher.match(path)
+
+    def getRoutes(self):
+        return [rule for matcher in self._hosts.values() for rule in matcher.getRules()]
+
+    def __len__(self):
+        return sum(len(matcher) for matcher in self._hosts.values())
+
+
+class SitePool:
+    """
+    The per bucket objects (ObjectStore and friends) a container has built so far, keyed by
+    (region, bucket). Each is built by factory the first time a request needs it.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def get(self, region, bucket):
+        key = (region, bucket)
+        site = self._sites.get(key)
+        if None == site:
+            with self._lock:
+                site = self._sites.get(key)
+                if None == site:
+                    site = self._factory(region, bucket)
+                    self._sites[key] = site
+        return site
+
+    def getSites(self):
+        return dict(self._sites)
@@ -0,0 +1,122 @@
+import hashlib
+import html
+import logging
+import re
+import time
+
+from ObjectStore import StoredObject
+
+# {{ name }} - the names are session claims (plus a few extras, see TemplateRenderer.values).
+# Any other {{ ... }} (e.g. for Vue or Handlebars in the browser) is left as it is
+PLACEHOLDER = re.compile(rb"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+
+class Template:
+    """
+    An HTML object split, once, into its literal text and the placeholders between it, so that
+    rendering is a single join rather than a search of the whole document.
+    """
+    # bookkeeping allowance per placeholder when sizing for the cache
+    PLACEHOLDER_OVERHEAD = 64
+
+    def __init__(self, name, etag, content):
+        self.name = name
+        self.etag = etag
+        self.fetched = time.monotonic()
+
+        content = bytes(content)
+        self._literals = []
+        self._keys = []
+        # each placeholder as written, for when there's no value for it
+        self._placeholders = []
+        start = 0
+        for match in PLACEHOLDER.finditer(content):
+            self._literals.append(content[start:match.start()])
+            self._keys.append(match.group(1).decode("ascii"))
+            self._placeholders.append(match.group(0))
+            start = match.end()
+        self._literals.append(content[start:])
+        self._size = len(content)
+
+    def isStatic(self):
+        return not self._keys
+
+    def getKeys(self):
+        return list(self._keys)
+
+    def size(self):
+        return self._size + self.PLACEHOLDER_OVERHEAD * len(self._keys)
+
+    def render(self, values):
+        """values maps placeholder names to already escaped bytes. Placeholders without a value are left as written."""
+        out = [self._literals[0]]
+        for key, placeholder, literal in zip(self._keys, self._placeholders, self._literals[1:]):
+            out.append(values.get(key, placeholder))
+            out.append(literal)
+        return b"".join(out)
+
+
+class TemplateRenderer:
+    """
+    Personalises HTML objects for the signed in user, e.g. <p>Hello {{name}}</p>.
+
+    The compiled Template for an object is kept in the object cache alongside it and recompiled only
+    when the object's ETag changes. Values are HTML escaped.
+
+    A personalised page gets its own weak ETag (the object's plus a hash of the values) and no
+    Last-Modified, and callers should mark it private, so that no cache hands one user's page to another.
+    """
+    _cache = None
+
+    def __init__(self, cache=None):
+        self._cache = cache
+
+    def getTemplate(self, store, obj):
+        key = store.cacheKey(obj.name) + ("template",)
+        if None != self._cache:
+            cached = self._cache.get(key)
+            if cached and cached.etag == obj.getETag():
+                return cached
+
+        started = time.perf_counter()
+        template = Template(obj.name, obj.getETag(), obj.content)
+        logging.debug("Compiled template %s with %d placeholders in %.3fms", obj.name, len(template.getKeys()),
+                      (time.perf_counter() - started) * 1000)
+        if None != self._cache:
+            self._cache.put(key, template)
+        return template
+
+    @staticmethod
+    def values(session, extra=None):
+        """The placeholder values available for a session: its claims, user (the subject) and name."""
+        values = {}
+        for key, value in session.items():
+            if isinstance(value, (str, int, float)):
+                values[key] = value
+        values["user"] = session.get("sub")
+        values["name"] = session.get("name") or session.get("sub")
+        values.update(extra or {})
+        return values
+
+    def personalise(self, store, obj, values):
+        """Returns obj rendered with values, or obj itself if it has nothing to fill in."""
+        template = self.getTemplate(store, obj)
+        if template.isStatic():
+            return obj
+
+        escaped = {}
+        for key in template.getKeys():
+            if key in values and not key in escaped:
+                escaped[key] = html.escape(str(values[key])).encode("utf-8")
+        if not escaped:
+            # only placeholders we have no values for, e.g. a page using a client side template library
+            return obj
+        content = template.render(escaped)
+
+        rendered = StoredObject(obj.name, content, obj.headers)
+        rendered.headers["Content-Length"] = str(len(content))
+        rendered.headers.pop("Last-Modified", None)
+        if obj.getETag():
+            digest = hashlib.sha256(b"\0".join(escaped.get(key, b"") for key in sorted(escaped))).hexdigest()[:12]
+            rendered.headers["ETag"] = 'W/"{}-{}"'.format(obj.getETag().strip('"'), digest)
+        return rendered
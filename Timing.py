@@ -0,0 +1,111 @@
+import contextvars
+import time
+
+
+class PhaseTimer:
+    """
+    Records how long each phase of a piece of work took, using the monotonic performance counter.
+    """
+    def __init__(self, started=None):
+        if None == started:
+            started = time.perf_counter()
+        self._started = started
+        self._last = started
+        self._phases = []
+
+    def mark(self, name):
+        """Ends the current phase, naming it, and starts the next one."""
+        now = time.perf_counter()
+        self._phases.append((name, now - self._last))
+        self._last = now
+
+    def add(self, name, seconds):
+        """Records a phase that was timed separately."""
+        self._phases.append((name, seconds))
+
+    def getPhases(self):
+        return list(self._phases)
+
+    def asDict(self):
+        """Phase durations (and the total) in milliseconds."""
+        timings = {}
+        for name, seconds in self._phases:
+            timings[name] = round(seconds * 1000, 3)
+        timings["total"] = round(sum(seconds for _, seconds in self._phases) * 1000, 3)
+        return timings
+
+
+class RequestTimer(PhaseTimer):
+    """
+    A PhaseTimer for a single invocation that also collects what happened upstream:
+    time spent in Object Storage calls, how many there were and whether the cache answered.
+    """
+    enabled = True
+
+    def __init__(self, started=None):
+        super().__init__(started)
+        self._upstreamSeconds = 0.0
+        self._upstreamCalls = 0
+        self._notes = {}
+
+    def upstream(self, seconds):
+        self._upstreamSeconds += seconds
+        self._upstreamCalls += 1
+
+    def note(self, name, value):
+        self._notes[name] = value
+
+    def serverTiming(self):
+        """The phases as a Server-Timing header value."""
+        metrics = ["{};dur={:.3f}".format(name, seconds * 1000) for name, seconds in self._phases]
+        if self._upstreamCalls:
+            metrics.append("upstream;dur={:.3f}".format(self._upstreamSeconds * 1000))
+        return ", ".join(metrics)
+
+    def record(self, **fields):
+        """A dict suitable for logging as one structured line."""
+        record = dict(fields)
+        record.update(self._notes)
+        record["timings"] = self.asDict()
+        record["upstreamCalls"] = self._upstreamCalls
+        record["upstreamMs"] = round(self._upstreamSeconds * 1000, 3)
+        return record
+
+
+class NullTimer:
+    """Stands in for a RequestTimer when instrumentation is off so callers never have to check."""
+    enabled = False
+
+    def mark(self, name):
+        pass
+
+    def add(self, name, seconds):
+        pass
+
+    def upstream(self, seconds):
+        pass
+
+    def note(self, name, value):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+# a context variable rather than a thread local so that work offloaded to another thread
+# (see Offload.run) is still counted against the invocation that asked for it
+_current = contextvars.ContextVar("timer", default=NULL_TIMER)
+
+
+def begin(enabled):
+    """Starts timing the current invocation and returns its timer."""
+    timer = RequestTimer() if enabled else NULL_TIMER
+    _current.set(timer)
+    return timer
+
+
+def current():
+    return _current.get()
+
+
+def end():
+    _current.set(NULL_TIMER)
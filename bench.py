@@ -0,0 +1,296 @@
+"""
+Benchmark / load test for the function, run entirely on this machine.
+
+The bucket is a generated site in a temporary directory served by LocalObjectStorageClient (with
+simulated Object Storage latency) and IDCS is a FakeIDCS. Requests go through the FDK's test fixtures
+into func.handler_async exactly as they would in OCI Functions, from --concurrency workers, picking
+scenarios at random by weight:
+
+    hot         a handful of small pages and assets requested over and over
+    cold        one of many distinct assets, so mostly cache misses
+    revalidate  a hot page with a matching If-None-Match (304)
+    protected   a protected page with a valid session cookie
+    callback    the OpenID Connect callback: token exchange and ID token verification
+    large       a file too big for the object cache
+    missing     an object that doesn't exist (404)
+
+It reports throughput and p50/p95/p99 latency per scenario, peak RSS, and how many calls were made to
+Object Storage and IDCS. The exit status is 1 if any request got an unexpected status.
+
+    python bench.py --requests 2000 --concurrency 8 --latency-ms 20
+    python bench.py --mix hot=1,missing=1 --config Manifest=list --json results.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+from fdk import fixtures
+
+HOST = "bench.example.com"
+CLIENT_ID = "benchclient"
+SESSION_KEY = "bench session key"
+
+# scenario => (weight, expected status)
+SCENARIOS = {
+    "hot": (50, 200),
+    "cold": (15, 200),
+    "revalidate": (10, 304),
+    "protected": (10, 200),
+    "callback": (2, 302),
+    "large": (3, 200),
+    "missing": (10, 404),
+}
+
+HOT_PATHS = ["/", "/css/site.css", "/js/app.js", "/img/logo.png"]
+
+
+def randomBytes(rng, n):
+    """n bytes from rng. Random.randbytes would do, but only from Python 3.9."""
+    return rng.getrandbits(8 * n).to_bytes(n, "little") if n else b""
+
+
+def buildSite(root, coldObjects, coldBytes, largeBytes):
+    """Writes the bucket's contents. Returns the ETag (as LocalObjectStorageClient computes it) of each hot page."""
+    rng = random.Random(0)
+
+    def write(name, content):
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        return hashlib.md5(content).hexdigest()
+
+    etags = {}
+    page = ('<html><head><link rel="stylesheet" href="/css/site.css"><script src="/js/app.js"></script></head>'
+            '<body><img src="/img/logo.png">' + "<p>Lorem ipsum dolor sit amet.</p>" * 200 + "</body></html>").encode()
+    etags["/"] = write("index.html", page)
+    etags["/css/site.css"] = write("css/site.css", b"body { margin: 0 }\n" * 400)
+    etags["/js/app.js"] = write("js/app.js", b"console.log('hello');\n" * 800)
+    etags["/img/logo.png"] = write("img/logo.png", randomBytes(rng, 24 * 1024))
+    write("members/index.html", b"<html><body><p>Welcome {{name}}</p>" + b"<p>Members only.</p>" * 100 + b"</body></html>")
+    for i in range(coldObjects):
+        write("assets/cold-{}.js".format(i), ("var x{} = 1;\n".format(i) * (coldBytes // 12)).encode())
+    write("video/large.bin", randomBytes(rng, largeBytes))
+    return etags
+
+
+class Workload:
+    def __init__(self, args, etags, sessionCookie):
+        self._args = args
+        self._etags = etags
+        self._cookie = sessionCookie
+        self._rng = random.Random(args.seed)
+
+        self._names = []
+        self._weights = []
+        for name, weight in args.mix.items():
+            if weight > 0:
+                self._names.append(name)
+                self._weights.append(weight)
+
+    def next(self):
+        """(scenario, url, method, headers) for the next request."""
+        scenario = self._rng.choices(self._names, self._weights)[0]
+        headers = {"Host": HOST, "Accept-Encoding": "gzip, br"}
+        url = "/"
+        if scenario == "hot":
+            url = self._rng.choice(HOT_PATHS)
+        elif scenario == "cold":
+            url = "/assets/cold-{}.js".format(self._rng.randrange(self._args.cold_objects))
+        elif scenario == "revalidate":
+            url = self._rng.choice(HOT_PATHS)
+            headers["If-None-Match"] = '"{}"'.format(self._etags[url])
+        elif scenario == "protected":
+            url = "/members/"
+            headers["Cookie"] = "session=" + self._cookie
+        elif scenario == "callback":
+            url = "/callback/?code=alice&state=/members/"
+        elif scenario == "large":
+            url = "/video/large.bin"
+        elif scenario == "missing":
+            url = "/nope-{}.html".format(self._rng.randrange(1000))
+        return scenario, url, "GET", headers
+
+
+def configure(args, site, idp):
+    """The function's configuration, via the environment the FDK reads it from."""
+    settings = {
+        "BucketName": "bench",
+        "Namespace": "bench",
+        "LocalBucketPath": site,
+        "LocalLatencyMs": str(args.latency_ms),
+        "ProtectedPaths": "/members/",
+        "IDCSURL": idp.url,
+        "ClientID": CLIENT_ID,
+        "ClientSecret": "bench secret",
+        "SessionKey": SESSION_KEY,
+    }
+    for setting in args.config:
+        name, _, value = setting.partition("=")
+        settings[name] = value
+    os.environ.update(settings)
+    # the fake IDCS is plain http
+    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+
+
+async def invoke(handler, url, method, headers):
+    started = time.perf_counter()
+    call = await fixtures.setup_fn_call(handler, request_url=url, method=method, headers=headers, gateway=True)
+    _, status, _ = await call
+    return status, time.perf_counter() - started
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(p / 100.0 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(latencies, seconds):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / seconds, 1) if seconds else None,
+        "p50": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "p99": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+    }
+
+
+async def run(args):
+    import func
+    from Session import SessionManager
+
+    # log lines are still formatted and written, as they would be in OCI, just not to the terminal
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(logging.StreamHandler(open(args.log_file, "a")))
+    root.setLevel(args.log_level)
+
+    handler = func.handler_async
+    sessions = SessionManager(SESSION_KEY)
+    workload = Workload(args, args.etags, sessions.issue("alice", {"name": "Alice"}))
+
+    # the first request pays for the cold start. Report it on its own
+    status, coldStart = await invoke(handler, "/", "GET", {"Host": HOST})
+    if status != 200:
+        raise RuntimeError("Function did not start properly: status {}".format(status))
+
+    results = {name: [] for name in SCENARIOS}
+    unexpected = {}
+    remaining = [args.requests]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            scenario, url, method, headers = workload.next()
+            status, seconds = await invoke(handler, url, method, headers)
+            results[scenario].append(seconds)
+            if status != SCENARIOS[scenario][1]:
+                key = "{} {}".format(scenario, status)
+                unexpected[key] = unexpected.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "latencyMs": args.latency_ms,
+        "seconds": round(elapsed, 3),
+        "coldStartMs": round(coldStart * 1000, 2),
+        "overall": summarize([s for values in results.values() for s in values], elapsed),
+        "scenarios": {name: summarize(values, elapsed) for name, values in results.items() if values},
+        "unexpected": unexpected,
+        # ru_maxrss is in KiB on Linux
+        "peakRSSMiB": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+        "objectStorageCalls": func.myosc.getClient().getStats(),
+        "idcsRequests": dict(args.idp.requests),
+        "objectCache": func.myosc.getCacheStats(),
+        "sharedFetches": func.myosc.getFlightStats(),
+        "upstream": func.myosc.getUpstreamStats(),
+    }
+    return report
+
+
+def printReport(report):
+    print("{} requests, concurrency {}, {}ms simulated Object Storage latency".format(
+        report["requests"], report["concurrency"], report["latencyMs"]))
+    print("cold start {}ms, run {}s, peak RSS {}MiB".format(report["coldStartMs"], report["seconds"], report["peakRSSMiB"]))
+    print()
+    print("{:<12} {:>8} {:>9} {:>9} {:>9} {:>9}".format("scenario", "requests", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+    rows = list(report["scenarios"].items()) + [("overall", report["overall"])]
+    for name, s in rows:
+        print("{:<12} {:>8} {:>9} {:>9} {:>9} {:>9}".format(name, s["requests"], s["rps"], s["p50"], s["p95"], s["p99"]))
+    print()
+    print("Object Storage calls: {}".format(report["objectStorageCalls"]))
+    print("IDCS requests:        {}".format(report["idcsRequests"]))
+    print("Object cache:         {}".format(report["objectCache"]))
+    print("Shared fetches:       {}".format(report["sharedFetches"]))
+    print("Retries / breaker:    {}".format(report["upstream"]))
+    if report["unexpected"]:
+        print("UNEXPECTED STATUSES:  {}".format(report["unexpected"]))
+
+
+def parseMix(value):
+    mix = {name: 0 for name in SCENARIOS}
+    for entry in value.split(","):
+        name, _, weight = entry.partition("=")
+        if not name.strip() in SCENARIOS:
+            raise argparse.ArgumentTypeError("Unknown scenario {}".format(name))
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the function against local stand-ins for Object Storage and IDCS")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=int, default=20, help="simulated Object Storage round trip")
+    parser.add_argument("--idcs-latency-ms", type=int, default=50, help="simulated IDCS round trip")
+    parser.add_argument("--mix", type=parseMix, default={name: weight for name, (weight, _) in SCENARIOS.items()},
+                        help="scenario weights, e.g. hot=50,cold=15,missing=10")
+    parser.add_argument("--cold-objects", type=int, default=500)
+    parser.add_argument("--cold-bytes", type=int, default=16 * 1024)
+    parser.add_argument("--large-bytes", type=int, default=16 * 1024 * 1024)
+    parser.add_argument("--config", action="append", default=[], metavar="SETTING=VALUE",
+                        help="extra function configuration, e.g. Manifest=list. May be repeated")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--log-file", default=os.devnull, help="where the function's log lines go")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    from FakeIDCS import FakeIDCS
+
+    site = tempfile.mkdtemp(prefix="demosite-bench-")
+    args.idp = FakeIDCS(CLIENT_ID, delay=args.idcs_latency_ms / 1000.0)
+    args.idp.addKey("bench")
+    try:
+        args.etags = buildSite(site, args.cold_objects, args.cold_bytes, args.large_bytes)
+        configure(args, site, args.idp)
+        report = asyncio.run(run(args))
+    finally:
+        args.idp.shutdown()
+        shutil.rmtree(site, ignore_errors=True)
+
+    printReport(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["unexpected"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,36 +1,284 @@
+import time
+# this has to come first so the cold start timing includes all the imports
+_loadStarted = time.perf_counter()
+
 import io
 import json
 import logging
-import pytest
+import mimetypes
+import os
+import threading
 
-from fdk import fixtures
-from fdk import response
+import oci
 
-from oauthlib.oauth2 import WebApplicationClient
+from fdk import response
 
 # fnConfig = None
 from Configuration import Configuration
-from ObjectStore import ObjectStore
-
-# we declare these 2 globally to save compute time on every invocation
+from AccessLog import AccessLog
+import ObjectStore as ObjectStoreModule
+from ObjectStore import ObjectStore, BufferBudget, ObjectTooLargeError
+from ObjectCache import ObjectCache
+from Manifest import BucketManifest
+from Prefetch import Prefetcher
+import Resilience
+from Resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+from Sites import SitePool
+from Template import TemplateRenderer
+from Compression import ContentNegotiator
+from OIDC import OpenIDProvider
+import HTTPClient
+import Offload
+from Session import SessionManager
+from Timing import PhaseTimer
+import Timing
+import HTTPUtil
+
+# we declare these globally to save compute time on every invocation
 fnConfig = None
+# the default site's ObjectStore and ContentNegotiator. Other sites' are built on demand in sitePool
 myosc = None
+negotiator = None
+sitePool = None
+# shared by every site
+objectCache = None
+bufferBudget = None
+sessions = None
+oidc = None
+prefetcher = None
+accessLog = None
+templates = None
+
+# signs the user out of the site (and IDCS). Templated pages can link to it as {{logoutURL}}
+LOGOUT_PATH = "/logout/"
+
+# guards the one time set up when invocations arrive concurrently (see handler_async)
+_initLock = threading.Lock()
+_initialized = False
+
+# cold start timing. Reported (and then dropped) once the first object has been served
+coldStart = PhaseTimer(_loadStarted)
+coldStart.mark("import")
+
+# when running in OCI Functions get the Resource Principal signer going while the FDK starts up
+if "OCI_RESOURCE_PRINCIPAL_VERSION" in os.environ:
+    ObjectStoreModule.prewarmSigner()
+
+
+def buildSite(region, bucket):
+    """The ObjectStore and ContentNegotiator for a bucket. Every site shares the cache, buffer budget and clients."""
+    client = None
+    if fnConfig.getLocalBucketPath():
+        # only for local runs and benchmarks, so it isn't loaded in a deployed function
+        from LocalObjectStorage import LocalObjectStorageClient
+        path = fnConfig.getLocalBucketPath()
+        if bucket != fnConfig.getBucketName():
+            path = os.path.join(path, bucket)
+        client = LocalObjectStorageClient(path, latency=fnConfig.getLocalLatencyMs() / 1000.0)
+
+    # every bucket is in the function's tenancy so the namespace only needs looking up once
+    namespace = fnConfig.getNamespace() or (myosc.getNamespace() if myosc else None)
+    retry = RetryPolicy(fnConfig.getObjectStorageRetries(), fnConfig.getObjectStorageRetryBackoffMs() / 1000.0)
+    breaker = CircuitBreaker("Object Storage bucket {}".format(bucket),
+                             fnConfig.getCircuitBreakerFailures(), fnConfig.getCircuitBreakerResetSeconds())
+    store = ObjectStore(region, bucket, objectCache, namespace,
+                        bufferBudget, fnConfig.getStreamChunkBytes(), client,
+                        retry, breaker, fnConfig.getStaleIfError())
+
+    if fnConfig.manifestEnabled():
+        # loads in the background. Requests go straight to Object Storage until it's ready
+        manifest = BucketManifest(store, fnConfig.getManifest(), fnConfig.getManifestRefresh())
+        store.setManifest(manifest)
+        manifest.start()
+
+    siteNegotiator = None
+    if fnConfig.compressionEnabled():
+        siteNegotiator = ContentNegotiator(store, objectCache,
+                                           precompressed=fnConfig.getPrecompressed(),
+                                           dynamic=fnConfig.getCompression(),
+                                           minBytes=fnConfig.getCompressionMinBytes(),
+                                           maxBytes=fnConfig.getCompressionMaxBytes(),
+                                           missingTTL=fnConfig.getCacheTTL())
+    return store, siteNegotiator
+
+
+def upstreamErrorResponse(ctx, e, objectname):
+    """
+    The response for a failed Object Storage call: 404 for a missing object, 429 if we are being throttled
+    and 503 if it is failing or the circuit breaker has stopped us asking. A body too big for the buffer
+    budget is a 500 that says so. None for anything else, which is a fault of ours and so a 500 too.
+    """
+    if isinstance(e, ObjectTooLargeError):
+        # too big to hold in memory. Byte ranges of it can still be fetched
+        logging.error("%s is too large to serve whole: %s", objectname, e)
+        return response.Response(
+            ctx, status_code=500,
+            response_data="File too large to serve whole, request it in byte ranges",
+            headers={"Content-Type": "text/plain", "Accept-Ranges": "bytes"}
+        )
+    if isinstance(e, oci.exceptions.ServiceError) and 404 == e.status:
+        logging.debug("%s not found, returning 404", objectname)
+        return response.Response(
+            ctx, status_code=404,
+            response_data="File not found",
+            headers={"Content-Type": "text/plain"}
+        )
+    if not (isinstance(e, CircuitOpenError) or Resilience.isRetryable(e)):
+        return None
+
+    status = 503
+    message = "Service unavailable, please try again shortly"
+    if isinstance(e, oci.exceptions.ServiceError) and 429 == e.status:
+        status = 429
+        message = "Too many requests, please try again shortly"
+    logging.warning("Getting %s failed (%s), returning %d", objectname, Resilience.describe(e), status)
+    return response.Response(
+        ctx, status_code=status,
+        response_data=message,
+        headers={"Content-Type": "text/plain", "Retry-After": Resilience.retryAfterHeader(e), "Cache-Control": "no-store"}
+    )
+
+
+def rangeResponse(ctx, store, meta, ranges, cacheControl):
+    """Builds a 206 response for the given byte ranges, fetching only those bytes."""
+    size = meta.getTotalLength()
+    headers = HTTPUtil.validatorHeaders(meta, cacheControl)
+    headers["Accept-Ranges"] = "bytes"
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        part = store.getObject(meta.name, (start, end))
+        headers["Content-Type"] = meta.getContentType()
+        headers["Content-Range"] = HTTPUtil.contentRange(start, end, size)
+        headers["Content-Length"] = str(part.size())
+        return response.Response(ctx, status_code=206, response_data=part.content, headers=headers)
+
+    parts = []
+    for start, end in ranges:
+        parts.append((start, end, store.getObject(meta.name, (start, end)).content))
+    body, headers["Content-Type"] = HTTPUtil.multipartByteRanges(parts, meta.getContentType(), size)
+    headers["Content-Length"] = str(len(body))
+    return response.Response(ctx, status_code=206, response_data=body, headers=headers)
+
+async def handler_async(ctx, data: io.BytesIO=None):
+    """
+    Entry point for the FDK that keeps its event loop free: the invocation runs on the bounded
+    Offload pool, so while one is waiting on Object Storage or IDCS the loop can take the next.
+    """
+    return await Offload.run(handler, ctx, data)
 
-callbackURL = None
 
 def handler(ctx, data: io.BytesIO=None):
-    logging.getLogger().info("Inside Python function")
+    # timing is switched on by configuration, so the very first invocation isn't timed.
+    # Cold start timing covers that one.
+    started = time.perf_counter()
+    timer = Timing.begin(None != fnConfig and fnConfig.instrumentationEnabled())
+    try:
+        resp = _handle(ctx, data)
+    finally:
+        Timing.end()
+        if myosc:
+            # the budget is shared by every site so any store can give it back
+            myosc.releaseBuffers()
+
+    if not isinstance(resp, response.Response):
+        # the debug info for a non-HTTP invocation is a plain string. Wrap it as the FDK would
+        resp = response.Response(ctx, response_data=resp, headers={"Content-Type": "text/plain"})
+
+    if timer.enabled:
+        timer.mark("response")
+        ctx.SetResponseHeaders({"Server-Timing": timer.serverTiming()}, resp.status())
+
+    if accessLog and accessLog.sampled():
+        body = resp.body()
+        fields = {
+            "method": ctx.Method(),
+            "uri": ctx.RequestURL(),
+            "status": resp.status(),
+            "bytes": len(body) if isinstance(body, (bytes, bytearray)) else len(str(body).encode()),
+            "ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+        accessLog.log(timer.record(**fields) if timer.enabled else fields)
+    return resp
+
+
+def _handle(ctx, data: io.BytesIO=None):
+    logging.debug("Inside Python function")
 
     global fnConfig
     global myosc
+    global negotiator
+    global sitePool
+    global objectCache
+    global bufferBudget
+    global sessions
+    global oidc
+    global prefetcher
+    global accessLog
+    global templates
+    global coldStart
+    global _initialized
 
     try:
-        if None == fnConfig:
-            fnConfig = Configuration(ctx.Config())
-
-            # if the config is OK then initialize the Objest Store layer
-            if fnConfig.isConfigOK():
-                myosc = ObjectStore(fnConfig.getRegion(), fnConfig.getBucketName())
+        if not _initialized:
+            with _initLock:
+                try:
+                    if None == fnConfig:
+                        if coldStart:
+                            # don't count the time the container sat idle before the first request
+                            coldStart.mark("idle")
+                        fnConfig = Configuration(ctx.Config())
+                        if fnConfig.getLogLevel():
+                            logging.getLogger().setLevel(fnConfig.getLogLevel())
+                        if fnConfig.isConfigOK():
+                            accessLog = AccessLog(fnConfig.getAccessLogSampleRate())
+                        if coldStart:
+                            coldStart.mark("config")
+
+                        # if the config is OK then initialize the Objest Store layer
+                        if fnConfig.isConfigOK():
+                            if fnConfig.cacheEnabled():
+                                objectCache = ObjectCache(fnConfig.getCacheMaxBytes(),
+                                                          fnConfig.getCacheMaxEntryBytes(),
+                                                          fnConfig.getCacheTTL())
+                            if fnConfig.getMaxBufferedBytes() > 0:
+                                bufferBudget = BufferBudget(fnConfig.getMaxBufferedBytes())
+
+                            ObjectStoreModule.setTimeouts(fnConfig.getObjectStorageConnectTimeout(),
+                                                          fnConfig.getObjectStorageReadTimeout())
+                            # the default site is built now. Any others when their first request arrives
+                            sitePool = SitePool(buildSite)
+                            myosc, negotiator = sitePool.get(fnConfig.getRegion(), fnConfig.getBucketName())
+                            if coldStart:
+                                coldStart.mark("auth")
+
+                            # warm the cache in the background so the first visitors don't wait on Object Storage
+                            if fnConfig.prefetchEnabled():
+                                prefetcher = Prefetcher(myosc, fnConfig.getPrefetchPaths(),
+                                                        fnConfig.getPrefetchMaxBytes(),
+                                                        fnConfig.getPrefetchLinkedAssets(),
+                                                        fnConfig.getCacheMaxEntryBytes())
+                                prefetcher.start()
+
+                        if fnConfig.isConfigOK() and fnConfig.protectedPathsDefined():
+                            sessions = SessionManager(fnConfig.getSessionKey(), fnConfig.getSessionTTL())
+                            HTTPClient.configure(fnConfig.getIDCSConnectTimeout(),
+                                                 fnConfig.getIDCSReadTimeout(),
+                                                 fnConfig.getIDCSRetries())
+                            oidc = OpenIDProvider(fnConfig.getIDCSURL(), fnConfig.getClientID(), fnConfig.getOIDCMetadataTTL())
+                            if fnConfig.templatesEnabled():
+                                templates = TemplateRenderer(objectCache)
+
+                        if fnConfig.isConfigOK():
+                            Offload.configure(fnConfig.getWorkerThreads())
+                    _initialized = True
+                except Exception:
+                    # don't carry on half set up for the life of the container: the next invocation starts again
+                    fnConfig = myosc = negotiator = sitePool = objectCache = bufferBudget = None
+                    sessions = oidc = prefetcher = accessLog = templates = None
+                    raise
+
+        Timing.current().mark("config")
 
         # if we are invoked by a means other than HTTP we return some debugging info to the caller
         # TODO: add a way to test retrieve an object from the bucket
@@ -42,39 +290,47 @@ def handler(ctx, data: io.BytesIO=None):
             retstring += "\n"
             retstring += "Environment:\n"
             retstring += "------------\n"
-            import os
             for k, v in os.environ.items():
-                retstring += "%s=%s\n" % (k, v)
+                retstring += "%s=%s\n" % (k, Configuration.redacted(k, v))
             retstring += "\n"
 
             retstring += "Configuration OK: {}\n".format( fnConfig.isConfigOK() )
             retstring += "----------------  -----------------------------------------------------------------------\n"
             retstring += "     Bucket Name: {}\n".format( fnConfig.getBucketName())
             retstring += "          Region: {}\n".format( fnConfig.getRegion() )
+            retstring += "       Namespace: {}\n".format( fnConfig.getNamespace() )
             retstring += " Protected Paths: {}\n".format( fnConfig.getProtectedPaths() )
+            retstring += "    Public Paths: {}\n".format( fnConfig.getPublicPaths() )
             retstring += "        IDCS URL: {}\n".format( fnConfig.getIDCSURL() )
             retstring += "       Client ID: {}\n".format( fnConfig.getClientID() )
-            retstring += "          Secret: {}\n".format( fnConfig.getClientSecret() )
+            retstring += "          Secret: {}\n".format( Configuration.redacted("ClientSecret", fnConfig.getClientSecret()) )
+            if myosc:
+                retstring += "    Object Cache: {}\n".format( myosc.getCacheStats() )
+                retstring += " Bucket Manifest: {}\n".format( myosc.getManifestStats() )
+                retstring += "  Shared Fetches: {}\n".format( myosc.getFlightStats() )
+                retstring += "  Object Storage: {}\n".format( myosc.getUpstreamStats() )
+                retstring += "     Other Sites: {}\n".format( fnConfig.getSiteRoutes() )
+            if prefetcher:
+                retstring += "      Prefetched: {}\n".format( prefetcher.getStats() )
+            if oidc:
+                retstring += "   IDCS Requests: {}\n".format( HTTPClient.getClient().getStats() )
             return retstring
 
         else:
-            logging.debug("HTTP Headers:")
-            for k, v in ctx.HTTPHeaders().items():
-                logging.debug('"%s" => "%s"' % (k, v))
-                # logging.debug('"%s" => "%s"' % (k, ctx.HTTPHeaders().get(k)))
-                # k = k.upper()
-                # logging.debug('"%s" => "%s"' % (k, ctx.HTTPHeaders().get(k)))
-
-        global callbackURL
-        if not callbackURL:
-            logging.debug("Constructing callback URL")
-            logging.debug("Host: {}".format(ctx.HTTPHeaders().get("host")))
-            # we're assuming https here.
-            callbackURL = "https://" + ctx.HTTPHeaders().get("host") + "/callback/"
-            logging.debug("Callback URL: {}".format(callbackURL))
+            # the header dump is only worth building if someone is going to see it
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("HTTP Headers:")
+                for k, v in ctx.HTTPHeaders().items():
+                    logging.debug('"%s" => "%s"', k, Configuration.redacted(k, v))
+
+        # each site is its own host so the callback comes back to whichever one the user is on.
+        # we're assuming https here.
+        host = HTTPUtil.getHeader(ctx.HTTPHeaders(), "Host")
+        callbackURL = "https://" + str(host) + "/callback/"
+        logging.debug("Callback URL: %s", callbackURL)
 
         if fnConfig.isConfigOK():
-            logging.info("Configuration appears to be OK. Proceeding.")
+            logging.debug("Configuration appears to be OK. Proceeding.")
         else:
             logging.error("Configuration NOT ok. returning runtime error.")
             raise RuntimeError("Invalid configuration. Please see logs")
@@ -82,11 +338,14 @@ def handler(ctx, data: io.BytesIO=None):
         # now on to the meat of the function...
 
         # ctx.RequestURL() returns a URI, not a URL. For historical reasons.
-        logging.getLogger().info("URI: " + ctx.RequestURL() )
+        logging.debug("URI: %s", ctx.RequestURL())
         # URI will always be well formed (i.e. no ../ or anything like that) because the API GW
         # and/or FDK strip that out
 
         file_object_name = ctx.RequestURL()
+        # the signed in user's session, if this is a protected path and they are signed in
+        session = None
+        protected = False
 
         if fnConfig.protectedPathsDefined():
             # check the URL to see if it's protected
@@ -117,15 +376,16 @@ def handler(ctx, data: io.BytesIO=None):
 
                 # this is silly but we have to pre-pend the request URI with https://something in order to get the parse_request_uri_response to not complain about HTTP vs HTTPS
                 params = client.parse_request_uri_response( "https://me" + ctx.RequestURL() )
-                logging.debug("Client state: {}".format(params["state"]))
+                logging.debug("Client state: %s", params["state"])
 
                 if params["state"] and params["state"].startswith("/"):
                     # a little safety here - make sure state starts with / to prevent open an redirect attack
                     location = params["state"]
-                    logging.debug('Redirect location from state is now "{}"'.format(location))
+                    logging.debug('Redirect location from state is now "%s"', location)
                 if client.code:
                     azCode = client.code
-                    logging.info( 'AZ Code: "{}"'.format( azCode ))
+                    # the code can still be exchanged for a token, so it doesn't go in the log
+                    logging.debug("Got an authorization code")
 
                     # swap it
                     postpayload = client.prepare_request_body(
@@ -135,20 +395,15 @@ def handler(ctx, data: io.BytesIO=None):
                         client_secret=fnConfig.getClientSecret()
                     )
 
-                    logging.debug("POST payload: " + postpayload)
-
-                    import requests
-                    r = requests.post(
-                        fnConfig.getIDCSTokenEndpoint(),
+                    r = HTTPClient.getClient().post(
+                        oidc.getTokenEndpoint(),
                         data = urldecode(postpayload)
                     )
-                    logging.debug("HTTP response code {}".format(str(r.status_code)))
-
-                    logging.debug("POST payload response:")
-                    logging.debug(r.text)
+                    logging.debug("Token endpoint responded with HTTP %s", r.status_code)
 
+                    # the response is all tokens. Only its shape is logged
                     jr = json.loads( r.text )
-                    logging.debug( "JSON:\n{}".format( json.dumps(jr,indent=4,sort_keys=True)))
+                    logging.debug("Token response has %s", sorted(jr.keys()))
 
                     if not jr["id_token"]:
                         logging.error("No ID token")
@@ -156,68 +411,81 @@ def handler(ctx, data: io.BytesIO=None):
                         logging.debug("ID Token located in payload")
                         idtoken = jr["id_token"]
 
-                        # OK this is dangerous.
-                        # not super duper dangerous (since we got the payload over HTTPS
-                        # but still not great
+                        # check the signature against IDCS's published keys (cached in process)
                         import jwt
-                        claims = jwt.decode(idtoken, options={"verify_signature": False})
-
-                        logging.debug("Claims:")
-                        logging.debug( json.dumps( claims, indent=4 ) )
-
-                        username = claims["sub"]
-                        logging.debug("Username: {}".format(username))
+                        try:
+                            claims = oidc.verifyIDToken(idtoken)
+                        except jwt.InvalidTokenError as e:
+                            logging.error("ID token failed verification: %s", e)
+                            claims = None
+
+                        if claims:
+                            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                                logging.debug("Claims:")
+                                logging.debug(json.dumps(claims, indent=4))
+
+                            username = claims["sub"]
+                            logging.debug("Username: %s", username)
+
+                            # keep the display name (if IDCS gave us one) so pages can greet the user
+                            sessionClaims = {}
+                            displayName = claims.get("user_displayname") or claims.get("name")
+                            if displayName:
+                                sessionClaims["name"] = displayName
 
                 redirectHeaders = {
                     "location": location
                 }
                 if username:
-                    import codecs
-                    redirectHeaders["Set-Cookie"] = "username=" + codecs.encode(username, 'rot_13') + "; path=/"
+                    redirectHeaders["Set-Cookie"] = sessions.cookieHeader(sessions.issue(username, sessionClaims))
 
-                # import codecs
-                logging.debug('Redirecting to "{}" with username {}'.format(location,username))
+                logging.debug('Redirecting to "%s" with username %s', location, username)
                 return response.Response( ctx,
                                           headers = redirectHeaders,
                                           response_data = "Page moved",
                                           status_code = 302)
 
+            # signing out: forget the session here, then at IDCS too if it tells us where that's done
+            if ctx.RequestURL().startswith(LOGOUT_PATH):
+                location = oidc.getLogoutEndpoint() or "/"
+                logging.debug('Logging out, redirecting to "%s"', location)
+                return response.Response(ctx,
+                                         headers={"location": location,
+                                                  "Set-Cookie": sessions.expiredCookieHeader(),
+                                                  "Cache-Control": "no-store"},
+                                         response_data="Page moved",
+                                         status_code=302)
+
             # and then check the path to see if the URL they're accessing it protected
             if not fnConfig.isProtected( file_object_name ):
-                logging.info( "{} is NOT a protected path".format( file_object_name ) )
+                logging.debug("%s is NOT a protected path", file_object_name)
             else:
-                logging.info( "{} IS a protected path".format( file_object_name ) )
+                logging.debug("%s IS a protected path", file_object_name)
+                protected = True
 
+                # the session cookie is signed by us so checking it needs no call to IDCS
                 username = None
-                if None == ctx.HTTPHeaders().get("cookie"):
-                    logging.info("No cookie header.")
-                else:
-                    logging.debug("Getting cookies")
-                    cookies = ctx.HTTPHeaders().get("cookie").split(';')
-                    print( "Number of cookies: ".format( len(cookies)) )
-                    for cookie in cookies:
-                        # if we find a cookie with username= at start then that's the username
-                        if cookie.startswith( "username="):
-                            # we should be mnore careful here but this is just example code so...
-                            try:
-                                import codecs
-                                username = codecs.encode(cookie[9:], 'rot_13')
-                            except:
-                                logging.error("Failed to decode username from username cookie")
-
-                logging.info("Username: {}".format(username))
+                session = sessions.verify(HTTPUtil.getCookie(ctx.HTTPHeaders(), SessionManager.COOKIE_NAME))
+                if session:
+                    username = session["sub"]
+                    if sessions.needsRenewal(session):
+                        logging.debug("Renewing session")
+                        # the final Response will set the real status code
+                        ctx.SetResponseHeaders({"Set-Cookie": sessions.cookieHeader(sessions.renew(session))}, 200)
+
+                logging.debug("Username: %s", username)
 
                 if not username:
                     # construct the AZ URL call
                     from oauthlib.oauth2 import WebApplicationClient
                     client = WebApplicationClient(fnConfig.getClientID())
-                    location = client.prepare_request_uri( fnConfig.getIDCSAuthorizationEndpoint(),
+                    location = client.prepare_request_uri( oidc.getAuthorizationEndpoint(),
                                                         redirect_uri=callbackURL,
                                                         scope=['openid'],
                                                         state=ctx.RequestURL()
                                                         # scope = ['profile', 'openid'])
                                                            )
-                    logging.info("Redirecting user to " + location )
+                    logging.debug("Redirecting user to %s", location)
 
                     return response.Response( ctx,
                                               headers={
@@ -226,31 +494,131 @@ def handler(ctx, data: io.BytesIO=None):
                                               response_data = "Page moved",
                                               status_code = 302)
 
+        Timing.current().mark("auth")
+
         if file_object_name.endswith("/"):
-            logging.getLogger().info("Adding index.html to request URL " + file_object_name)
+            logging.debug("Adding index.html to request URL %s", file_object_name)
             file_object_name += "index.html"
-        # strip off the first character of the URI (i.e. the /)
-        file_object_name = file_object_name[1:]
 
-        logging.getLogger().info("getting object " + file_object_name)
+        # which bucket is this site in?
+        store, siteNegotiator = myosc, negotiator
+        route = fnConfig.getRoute(host, file_object_name)
+        if route:
+            logging.debug("Serving %s from %s", file_object_name, route)
+            store, siteNegotiator = sitePool.get(route.region or fnConfig.getRegion(), route.bucket)
+            file_object_name = route.objectName(file_object_name)
+        else:
+            # strip off the first character of the URI (i.e. the /)
+            file_object_name = file_object_name[1:]
+
+        # foo when there's a foo/index.html: send the browser to foo/ so the page's relative links work
+        if store.isDirectory(file_object_name):
+            location = ctx.RequestURL() + "/"
+            logging.debug("Redirecting directory to %s", location)
+            return response.Response(ctx,
+                                     headers={"Location": location},
+                                     response_data="Page moved",
+                                     status_code=301)
+
+        cacheControl = fnConfig.getCacheControl(ctx.RequestURL())
+        if protected:
+            # whatever the policy says, only the signed in user's browser may keep a copy
+            cacheControl = HTTPUtil.privateCacheControl(cacheControl)
+
+        logging.debug("getting object %s", file_object_name)
+        fetchStarted = time.perf_counter()
         try:
-            obj = myosc.getObject(file_object_name)
-        except:
-            # TODO: separate 404 from 500
-            logging.getLogger().info("Exception caught, returning 404!")
-            return response.Response(
-                ctx, response_data="File not found",
-                headers={"Content-Type": "text/plain"}
-            )
+            # if the browser already has a copy we can check it against the object's metadata
+            # and skip transferring the body entirely
+            meta = None
+            if HTTPUtil.isConditional(ctx.HTTPHeaders()):
+                meta = store.headObject(file_object_name)
+                if HTTPUtil.isNotModified(ctx.HTTPHeaders(), meta):
+                    logging.debug("Not modified, returning 304")
+                    headers = HTTPUtil.validatorHeaders(meta, cacheControl)
+                    if siteNegotiator:
+                        headers["Vary"] = "Accept-Encoding"
+                        # the same validator the 200 would have sent, which is weak if it would be compressed
+                        if headers.get("ETag"):
+                            headers["ETag"] = siteNegotiator.getETag(meta, HTTPUtil.getHeader(ctx.HTTPHeaders(), "Accept-Encoding"))
+                    return response.Response(
+                        ctx, status_code=304,
+                        headers=headers
+                    )
 
-        logging.getLogger().info("Returning response")
+            # HEAD only needs the metadata, which the cache or manifest may have without a network call
+            if "HEAD" == ctx.Method():
+                if None == meta:
+                    meta = store.headObject(file_object_name)
+                headers = HTTPUtil.objectHeaders(meta, cacheControl)
+                if siteNegotiator:
+                    headers["Vary"] = "Accept-Encoding"
+                return response.Response(ctx, headers=headers)
+
+            # range requests only transfer the bytes that were asked for
+            rangeHeader = HTTPUtil.getHeader(ctx.HTTPHeaders(), "Range")
+            if rangeHeader:
+                if None == meta:
+                    meta = store.headObject(file_object_name)
+                if HTTPUtil.rangeStillValid(ctx.HTTPHeaders(), meta):
+                    ranges = HTTPUtil.parseRange(rangeHeader, meta.getTotalLength())
+                    if ranges == []:
+                        logging.debug("Range not satisfiable, returning 416")
+                        return response.Response(
+                            ctx, status_code=416,
+                            headers={"Content-Range": "bytes */{}".format(meta.getTotalLength())}
+                        )
+                    if ranges:
+                        logging.debug("Returning %d range(s)", len(ranges))
+                        return rangeResponse(ctx, store, meta, ranges, cacheControl)
+
+            personalised = False
+            original = None
+            if templates and session and "text/html" == mimetypes.guess_type(file_object_name)[0]:
+                original = store.getObject(file_object_name)
+                if (original.getContentType() or "").startswith("text/html") and not original.headers.get("Content-Encoding"):
+                    obj = templates.personalise(store, original, TemplateRenderer.values(session, {"logoutURL": LOGOUT_PATH}))
+                    personalised = obj is not original
+                if personalised and siteNegotiator:
+                    # only good for this response, so compressed without being cached
+                    obj = siteNegotiator.encode(obj, HTTPUtil.getHeader(ctx.HTTPHeaders(), "Accept-Encoding"))
+
+            if not personalised:
+                # a page that turned out to have nothing to fill in has already been fetched
+                if siteNegotiator:
+                    obj = siteNegotiator.getObject(file_object_name, HTTPUtil.getHeader(ctx.HTTPHeaders(), "Accept-Encoding"), original)
+                elif None != original:
+                    obj = original
+                else:
+                    obj = store.getObject(file_object_name)
+        except Exception as e:
+            errorResponse = upstreamErrorResponse(ctx, e, file_object_name)
+            if None == errorResponse:
+                raise
+            return errorResponse
+
+        Timing.current().mark("fetch")
+
+        if coldStart:
+            coldStart.add("first-fetch", time.perf_counter() - fetchStarted)
+            logging.info("Cold start timing (ms): %s", json.dumps(coldStart.asDict()))
+            coldStart = None
+
+        if personalised:
+            # this user's copy only
+            cacheControl = "private, no-cache"
+        headers = HTTPUtil.objectHeaders(obj, cacheControl)
+        if siteNegotiator:
+            headers["Vary"] = "Accept-Encoding"
+
+        logging.debug("Returning response")
         return response.Response(
-            ctx, response_data=obj.data.content,
-            headers={"Content-Type": obj.headers['Content-type']}
+            ctx, response_data=obj.content,
+            headers=headers
         )
 
     except (Exception) as e:
-        logging.getLogger().critical('Exception: ' + str(e))
+        logging.critical('Exception: %s', e)
         logging.critical(e, exc_info=True)
 
         return response.Response(
@@ -291,13 +659,3 @@ def handler(ctx, data: io.BytesIO=None):
 # #
 # #     assert 202 == status
 # #     assert {"message": "Hello World"} == json.loads(content)
-
-
-@pytest.mark.asyncio
-async def test_parse_request_without_data():
-    call = await fixtures.setup_fn_call(handler)
-
-    content, status, headers = await call
-
-    assert 500 == status
-    # assert {"message": "Hello World"} == json.loads(content)
@@ -0,0 +1,73 @@
+import gzip
+
+from LocalObjectStorage import LocalObjectStorageClient
+from ObjectCache import ObjectCache
+from ObjectStore import ObjectStore
+from Compression import ContentNegotiator, acceptableEncodings
+from Resilience import CircuitBreaker
+
+CSS = b"body { margin: 0 }\n" * 200
+
+
+def makeNegotiator(objects, **kwargs):
+    client = LocalObjectStorageClient(objects=objects)
+    cache = ObjectCache(1024 * 1024, 1024 * 1024, 60)
+    store = ObjectStore(None, "site", cache, "local", client=client)
+    return ContentNegotiator(store, cache, **kwargs), client
+
+
+def test_accept_encoding_preference():
+    assert ["br", "gzip"] == acceptableEncodings("gzip, br")
+    assert ["gzip", "br"] == acceptableEncodings("gzip, br;q=0.5")
+    assert ["gzip"] == acceptableEncodings("*;q=0.1, br;q=0, gzip")
+    assert [] == acceptableEncodings("identity")
+
+
+def test_compresses_once_within_limits():
+    negotiator, client = makeNegotiator({"site.css": CSS, "big.css": CSS * 10, "tiny.css": b"p {}"}, maxBytes=len(CSS))
+
+    encoded = negotiator.getObject("site.css", "gzip")
+    assert "gzip" == encoded.headers["Content-Encoding"]
+    assert CSS == gzip.decompress(encoded.content)
+    assert encoded.getETag().startswith("W/")
+    assert encoded is negotiator.getObject("site.css", "gzip")
+
+    # too big for the cache, so it would be compressed over and over
+    assert not "Content-Encoding" in negotiator.getObject("big.css", "gzip").headers
+    assert not "Content-Encoding" in negotiator.getObject("tiny.css", "gzip").headers
+
+
+def test_precompressed_siblings_only_looked_for_compressible_types():
+    negotiator, client = makeNegotiator({"app.js": CSS, "app.js.gz": gzip.compress(CSS), "logo.png": b"\x89PNG" * 500},
+                                        precompressed=True, dynamic=False)
+
+    assert "gzip" == negotiator.getObject("app.js", "gzip, br").headers["Content-Encoding"]
+    calls = client.getStats()["get_object"]
+
+    assert not "Content-Encoding" in negotiator.getObject("logo.png", "gzip, br").headers
+    # just the image itself: no looking for logo.png.br or logo.png.gz
+    assert calls + 1 == client.getStats()["get_object"]
+
+
+def test_serves_cached_object_when_siblings_cannot_be_looked_for():
+    client = LocalObjectStorageClient(objects={"site.css": CSS})
+    cache = ObjectCache(1024 * 1024, 1024 * 1024, 60)
+    breaker = CircuitBreaker("site", failures=1, resetAfter=60)
+    store = ObjectStore(None, "site", cache, "local", client=client, breaker=breaker)
+    # a missingTTL of 0 means the siblings are looked for every time
+    negotiator = ContentNegotiator(store, cache, precompressed=True, dynamic=False, missingTTL=0)
+    assert not "Content-Encoding" in negotiator.getObject("site.css", "gzip, br").headers
+
+    breaker.failed()
+    assert CircuitBreaker.OPEN == breaker.getState()
+    assert CSS == negotiator.getObject("site.css", "gzip, br").content
+
+
+def test_etag_for_not_modified_matches_the_representation():
+    negotiator, client = makeNegotiator({"site.css": CSS, "tiny.css": b"p {}", "logo.png": b"\x89PNG" * 500})
+    store = negotiator._objectStore
+
+    for name in ("site.css", "tiny.css", "logo.png"):
+        meta = store.headObject(name)
+        for acceptEncoding in ("gzip", None):
+            assert negotiator.getObject(name, acceptEncoding).getETag() == negotiator.getETag(meta, acceptEncoding)
@@ -0,0 +1,99 @@
+import pytest
+
+import HTTPUtil
+
+from ObjectStore import StoredObject
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=900-", [(900, 999)]),
+    ("bytes=-100", [(900, 999)]),
+    ("bytes=-5000", [(0, 999)]),
+    ("bytes=500-5000", [(500, 999)]),
+    # out of order, overlapping and adjacent ranges come back sorted and merged
+    ("bytes=500-599, 0-9, 550-700, 10-19", [(0, 19), (500, 700)]),
+    ("bytes=0-9,,20-29", [(0, 9), (20, 29)]),
+])
+def test_parse_range(header, expected):
+    assert expected == HTTPUtil.parseRange(header, 1000)
+
+
+@pytest.mark.parametrize("header", [None, "", "items=0-9", "bytes=", "bytes=5", "bytes=9-0", "bytes=a-b"])
+def test_ignored_ranges(header):
+    assert None == HTTPUtil.parseRange(header, 1000)
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    # i.e. 416
+    assert [] == HTTPUtil.parseRange(header, 1000)
+
+
+def test_too_many_ranges():
+    many = ",".join("{}-{}".format(i * 10, i * 10 + 1) for i in range(HTTPUtil.MAX_RANGES + 1))
+    assert [] == HTTPUtil.parseRange("bytes=" + many, 1000)
+
+    # merging brings them back under the limit
+    merged = ",".join("0-{}".format(i) for i in range(HTTPUtil.MAX_RANGES + 1))
+    assert [(0, HTTPUtil.MAX_RANGES)] == HTTPUtil.parseRange("bytes=" + merged, 1000)
+
+
+def test_if_range():
+    obj = StoredObject("a.bin", b"", {"ETag": '"abc"', "Last-Modified": "Tue, 01 Jun 2021 10:00:00 GMT"})
+
+    assert HTTPUtil.rangeStillValid({}, obj)
+    assert HTTPUtil.rangeStillValid({"if-range": '"abc"'}, obj)
+    assert HTTPUtil.rangeStillValid({"if-range": "Tue, 01 Jun 2021 10:00:00 GMT"}, obj)
+    assert not HTTPUtil.rangeStillValid({"if-range": '"def"'}, obj)
+    assert not HTTPUtil.rangeStillValid({"if-range": 'W/"abc"'}, obj)
+    assert not HTTPUtil.rangeStillValid({"if-range": "Wed, 02 Jun 2021 10:00:00 GMT"}, obj)
+
+
+def test_multipart_byte_ranges():
+    body, contentType = HTTPUtil.multipartByteRanges([(0, 1, b"ab"), (5, 6, b"fg")], "text/plain", 10)
+
+    boundary = contentType.split("boundary=")[1]
+    assert contentType.startswith("multipart/byteranges; ")
+    assert b"Content-Range: bytes 5-6/10\r\n\r\nfg\r\n" in body
+    assert body.endswith("--{}--\r\n".format(boundary).encode())
+
+
+OBJECT = StoredObject("index.html", b"<html/>", {"ETag": '"abc"', "Last-Modified": "Tue, 01 Jun 2021 10:00:00 GMT"})
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"if-none-match": '"abc"'}, True),
+    ({"if-none-match": 'W/"abc"'}, True),
+    ({"if-none-match": '"xyz", "abc"'}, True),
+    ({"if-none-match": ['"xyz"', '"abc"']}, True),
+    ({"if-none-match": "*"}, True),
+    ({"if-none-match": '"xyz"'}, False),
+    ({"if-modified-since": "Tue, 01 Jun 2021 10:00:00 GMT"}, True),
+    ({"if-modified-since": "Wed, 02 Jun 2021 10:00:00 GMT"}, True),
+    ({"if-modified-since": "Mon, 31 May 2021 10:00:00 GMT"}, False),
+    ({"if-modified-since": "yesterday"}, False),
+    # If-None-Match wins when both are sent
+    ({"if-none-match": '"xyz"', "if-modified-since": "Wed, 02 Jun 2021 10:00:00 GMT"}, False),
+    ({}, False),
+])
+def test_not_modified(headers, expected):
+    assert bool(headers) == HTTPUtil.isConditional(headers)
+    assert expected == HTTPUtil.isNotModified(headers, OBJECT)
+
+
+def test_not_modified_needs_a_validator():
+    bare = StoredObject("index.html", b"<html/>", {})
+    assert not HTTPUtil.isNotModified({"if-none-match": '"abc"'}, bare)
+    assert not HTTPUtil.isNotModified({"if-modified-since": "Wed, 02 Jun 2021 10:00:00 GMT"}, bare)
+
+
+@pytest.mark.parametrize("policy, expected", [
+    ("public, max-age=86400", "private, max-age=86400"),
+    ("Public", "private"),
+    ("private, no-cache", "private, no-cache"),
+    ("no-store", "private, no-store"),
+    (None, "private"),
+])
+def test_private_cache_control(policy, expected):
+    assert expected == HTTPUtil.privateCacheControl(policy)
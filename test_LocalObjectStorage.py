@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import oci
+import pytest
+
+from LocalObjectStorage import LocalObjectStorageClient
+from Manifest import BucketManifest
+from ObjectCache import ObjectCache
+from ObjectStore import ObjectStore
+
+
+@pytest.fixture
+def client():
+    return LocalObjectStorageClient(objects={
+        "index.html": b"<html>hello</html>",
+        "docs/index.html": b"<html>docs</html>",
+        "video.bin": bytes(range(256)) * 4,
+    })
+
+
+def test_cached_and_revalidated(client):
+    store = ObjectStore(None, "bucket", ObjectCache(1024 * 1024, 1024 * 1024, 0), client=client)
+
+    assert b"<html>hello</html>" == store.getObject("index.html").content
+    # a TTL of 0 means every read revalidates, which Object Storage answers with a 304
+    assert b"<html>hello</html>" == store.getObject("index.html").content
+    assert {"get_namespace": 1, "get_object": 2} == client.getStats()
+    assert 1 == store.getCacheStats()["revalidated"]
+
+
+def test_ranges(client):
+    store = ObjectStore(None, "bucket", namespace="ns", client=client, chunkSize=100)
+
+    part = store.getObject("video.bin", (10, 19))
+    assert bytes(range(10, 20)) == part.content
+    assert 1024 == part.getTotalLength()
+
+
+def test_missing_objects_and_manifest(client):
+    store = ObjectStore(None, "bucket", namespace="ns", client=client)
+    with pytest.raises(oci.exceptions.ServiceError) as e:
+        store.getObject("nope.html")
+    assert 404 == e.value.status
+
+    manifest = BucketManifest(store, refreshInterval=0)
+    store.setManifest(manifest)
+    assert manifest.refresh()
+    calls = dict(client.getStats())
+
+    with pytest.raises(oci.exceptions.ServiceError):
+        store.getObject("nope.html")
+    assert store.isDirectory("docs")
+    assert "text/html" == store.headObject("index.html").getContentType()
+    assert calls == client.getStats()
+
+
+def test_benchmark_runs():
+    result = subprocess.run([sys.executable, "bench.py", "--requests", "60", "--concurrency", "4",
+                             "--latency-ms", "1", "--idcs-latency-ms", "1", "--large-bytes", "65536"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, timeout=300)
+    assert 0 == result.returncode, result.stdout + result.stderr
+    assert "overall" in result.stdout
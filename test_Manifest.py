@@ -0,0 +1,99 @@
+import datetime
+import json
+
+from types import SimpleNamespace
+
+from LocalObjectStorage import LocalObjectStorageClient
+from Manifest import BucketManifest
+from ObjectStore import ObjectStore, StoredObject
+
+
+class StandInStore:
+    """Just enough of ObjectStore for a manifest to load from, counting the calls made."""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = {"list": 0, "head": 0, "get": 0}
+
+    def listObjects(self):
+        self.calls["list"] += 1
+        modified = datetime.datetime(2021, 6, 1, 10, 0, tzinfo=datetime.timezone.utc)
+        for name, content in self.objects.items():
+            yield SimpleNamespace(name=name, size=len(content), etag="etag-" + name, time_modified=modified)
+
+    def headObject(self, objectname):
+        self.calls["head"] += 1
+        return StoredObject(objectname, None, {"ETag": "etag-{}".format(len(self.objects[objectname]))})
+
+    def getObject(self, objectname):
+        self.calls["get"] += 1
+        return StoredObject(objectname, self.objects[objectname], {"ETag": "etag-{}".format(len(self.objects[objectname]))})
+
+    def releaseBuffers(self):
+        pass
+
+
+def test_listing():
+    store = StandInStore({"index.html": b"<html/>", "docs/index.html": b"<html></html>", "app.js": b"x"})
+    manifest = BucketManifest(store)
+
+    assert not manifest.isLoaded()
+    assert not manifest.covers("index.html")
+    assert manifest.refresh()
+
+    assert manifest.covers("missing.html")
+    assert not manifest.contains("missing.html")
+    assert manifest.hasIndex("docs")
+    assert not manifest.hasIndex("app.js")
+
+    meta = manifest.get("index.html")
+    assert "text/html" == meta.getContentType()
+    assert 7 == meta.getTotalLength()
+    assert "etag-index.html" == meta.getETag()
+    assert "Tue, 01 Jun 2021 10:00:00 GMT" == meta.headers["Last-Modified"]
+    assert None == manifest.get("missing.html")
+
+
+def test_manifest_object_only_reloaded_when_changed():
+    document = {"objects": [{"name": "index.html", "size": 10, "etag": "abc", "contentType": "text/html; charset=utf-8"}]}
+    store = StandInStore({"manifest.json": json.dumps(document).encode()})
+    manifest = BucketManifest(store, "manifest.json")
+
+    assert manifest.refresh()
+    assert manifest.refresh()
+
+    assert 1 == store.calls["get"]
+    assert 2 == store.calls["head"]
+    assert "text/html; charset=utf-8" == manifest.get("index.html").getContentType()
+    # the manifest never claims its own object is missing
+    assert not manifest.covers("manifest.json")
+
+
+def test_failed_refresh_keeps_previous_index():
+    store = StandInStore({"index.html": b"<html/>"})
+    manifest = BucketManifest(store)
+    manifest.refresh()
+
+    def broken():
+        raise IOError("throttled")
+        yield
+    store.listObjects = broken
+
+    assert not manifest.refresh()
+    assert manifest.contains("index.html")
+    assert 1 == manifest.getStats()["failures"]
+
+
+def test_objects_listed_without_a_size_are_asked_about():
+    document = {"objects": [{"name": "index.html", "etag": "abc"}, {"name": "app.js", "size": 1}]}
+    client = LocalObjectStorageClient(objects={"manifest.json": json.dumps(document).encode(), "index.html": b"<html/>", "app.js": b"x"})
+    store = ObjectStore(None, "site", None, "local", client=client)
+    manifest = BucketManifest(store, "manifest.json")
+    assert manifest.refresh()
+    store.setManifest(manifest)
+    heads = client.getStats()["head_object"]
+
+    assert 1 == store.headObject("app.js").getTotalLength()
+    assert heads == client.getStats()["head_object"]
+    assert 7 == store.headObject("index.html").getTotalLength()
+    assert heads + 1 == client.getStats()["head_object"]
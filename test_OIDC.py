@@ -0,0 +1,105 @@
+import threading
+import time
+
+import jwt
+import pytest
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import HTTPClient
+
+from FakeIDCS import FakeIDCS
+from OIDC import OpenIDProvider
+
+CLIENT_ID = "democlient"
+
+
+@pytest.fixture
+def idp():
+    idp = FakeIDCS(CLIENT_ID)
+    idp.addKey("k1")
+    yield idp
+    idp.shutdown()
+
+
+def test_discovery_endpoints(idp):
+    provider = OpenIDProvider(idp.url, CLIENT_ID)
+
+    assert idp.url + "/oauth2/v1/authorize" == provider.getAuthorizationEndpoint()
+    assert idp.url + "/oauth2/v1/token" == provider.getTokenEndpoint()
+    assert 1 == idp.count(OpenIDProvider.DISCOVERY_PATH)
+
+
+def test_verify_caches_jwks(idp):
+    provider = OpenIDProvider(idp.url, CLIENT_ID)
+
+    for _ in range(5):
+        assert "alice" == provider.verifyIDToken(idp.idToken("k1"))["sub"]
+
+    assert 1 == idp.count("/jwks")
+    assert 1 == idp.count(OpenIDProvider.DISCOVERY_PATH)
+
+
+def test_rejects_bad_tokens(idp):
+    provider = OpenIDProvider(idp.url, CLIENT_ID)
+    forger = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    with pytest.raises(jwt.InvalidSignatureError):
+        provider.verifyIDToken(idp.idToken("k1", key=forger))
+    with pytest.raises(jwt.InvalidAudienceError):
+        provider.verifyIDToken(idp.idToken("k1", aud="someoneelse"))
+    with pytest.raises(jwt.ExpiredSignatureError):
+        provider.verifyIDToken(idp.idToken("k1", exp=int(time.time()) - 3600))
+
+
+def test_kid_miss_refreshes_once(idp):
+    provider = OpenIDProvider(idp.url, CLIENT_ID)
+    provider.MIN_REFRESH_INTERVAL = 0
+    provider.verifyIDToken(idp.idToken("k1"))
+
+    # the provider rolls its keys
+    idp.addKey("k2")
+    assert "alice" == provider.verifyIDToken(idp.idToken("k2"))["sub"]
+    assert 2 == idp.count("/jwks")
+
+
+def test_unknown_kid_is_rate_limited(idp):
+    provider = OpenIDProvider(idp.url, CLIENT_ID)
+    provider.verifyIDToken(idp.idToken("k1"))
+
+    forger = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    for _ in range(3):
+        with pytest.raises(jwt.InvalidTokenError):
+            provider.verifyIDToken(idp.idToken("nope", key=forger))
+    assert 1 == idp.count("/jwks")
+
+
+def test_burst_of_callbacks_fetches_once(idp):
+    provider = OpenIDProvider(idp.url, CLIENT_ID)
+    idp.delay = 0.2
+    token = idp.idToken("k1")
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(provider.verifyIDToken(token)["sub"])) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert ["alice"] * 10 == results
+    assert 1 == idp.count("/jwks")
+    assert 1 == idp.count(OpenIDProvider.DISCOVERY_PATH)
+
+
+def test_connections_are_reused(idp):
+    provider = OpenIDProvider(idp.url, CLIENT_ID)
+    client = HTTPClient.configure(5, 10, 2)
+
+    provider.MIN_REFRESH_INTERVAL = 0
+    provider.verifyIDToken(idp.idToken("k1"))
+    idp.addKey("k2")
+    provider.verifyIDToken(idp.idToken("k2"))
+
+    stats = client.getStats()
+    assert 3 == stats["requests"]
+    assert 1 == stats["connections"]
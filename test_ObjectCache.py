@@ -0,0 +1,63 @@
+import time
+
+from LocalObjectStorage import LocalObjectStorageClient
+from ObjectCache import ObjectCache
+from ObjectStore import ObjectStore, StoredObject
+
+OVERHEAD = ObjectCache.ENTRY_OVERHEAD
+
+
+def entry(name, size):
+    return StoredObject(name, b"x" * size, {"ETag": '"{}"'.format(name)})
+
+
+def test_evicts_least_recently_used_to_stay_under_byte_cap():
+    cache = ObjectCache(3 * (100 + OVERHEAD), 4096, 60)
+    for name in ("a", "b", "c"):
+        assert cache.put(name, entry(name, 100))
+
+    # a is now the most recently used, so b goes first
+    assert cache.get("a")
+    cache.put("d", entry("d", 100))
+    assert None == cache.get("b")
+    assert cache.get("a") and cache.get("c") and cache.get("d")
+
+    # a bigger entry pushes out as many as it needs to
+    assert cache.put("e", entry("e", 2 * 100 + OVERHEAD))
+    assert cache.get("e")
+    assert None == cache.get("a") and None == cache.get("c") and cache.get("d")
+    stats = cache.getStats()
+    assert 3 == stats["evictions"]
+    assert 2 == stats["entries"] and stats["bytes"] <= stats["maxBytes"]
+
+
+def test_rejects_entries_over_the_entry_limit():
+    cache = ObjectCache(10 * 1024, 1024, 60)
+
+    assert not cache.put("big", entry("big", 1024))
+    assert None == cache.get("big")
+    assert 1 == cache.getStats()["rejected"]
+
+    # replacing an entry with one that's too big drops the old one too
+    assert cache.put("a", entry("a", 10))
+    assert not cache.put("a", entry("a", 2048))
+    assert None == cache.get("a")
+    assert 0 == cache.getStats()["bytes"]
+
+
+def test_stale_entries_are_revalidated_with_a_304():
+    client = LocalObjectStorageClient(objects={"index.html": b"<html/>"})
+    cache = ObjectCache(1024 * 1024, 1024 * 1024, 0.05)
+    store = ObjectStore(None, "site", cache, "local", client=client)
+
+    first = store.getObject("index.html")
+    assert first is store.getObject("index.html")
+    assert 1 == client.getStats()["get_object"]
+
+    time.sleep(0.1)
+    assert not cache.isFresh(first)
+    # asked with If-None-Match, got a 304 and kept the same copy, fresh again
+    assert first is store.getObject("index.html")
+    assert 2 == client.getStats()["get_object"]
+    assert cache.isFresh(first)
+    assert 1 == cache.getStats()["revalidated"]
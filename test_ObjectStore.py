@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from LocalObjectStorage import LocalObjectStorageClient
+from ObjectCache import ObjectCache
+from ObjectStore import BufferBudget, ObjectStore, ObjectTooLargeError
+
+
+def _inThread(fn):
+    """Runs fn on a thread, as the Offload pool would, failing rather than hanging if it never finishes."""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive(), "blocked waiting on the buffer budget"
+    return result[0]
+
+
+def test_invocation_never_waits_on_its_own_buffers():
+    budget = BufferBudget(1000)
+    store = ObjectStore(None, "site", namespace="local", budget=budget,
+                        client=LocalObjectStorageClient(objects={"a.html": b"a" * 600, "b.html": b"b" * 600}))
+
+    def both():
+        sizes = (store.getObject("a.html").size(), store.getObject("b.html").size())
+        inUse = budget.getInUse()
+        store.releaseBuffers()
+        return sizes, inUse
+
+    assert ((600, 600), 1200) == _inThread(both)
+    assert 0 == budget.getInUse()
+
+
+def test_body_bigger_than_budget_is_not_read():
+    budget = BufferBudget(1000)
+    client = LocalObjectStorageClient(objects={"video.bin": b"v" * 1200})
+    store = ObjectStore(None, "site", namespace="local", budget=budget, client=client)
+
+    with pytest.raises(ObjectTooLargeError):
+        store.getObject("video.bin")
+    assert 0 == budget.getInUse()
+
+    # a range of it still fits
+    assert b"vvvv" == store.getObject("video.bin", (0, 3)).content
+
+
+def test_same_bucket_name_in_other_regions_is_cached_apart():
+    cache = ObjectCache(1024 * 1024, 1024 * 1024, 60)
+    ashburn = ObjectStore("us-ashburn-1", "site", cache, "local", client=LocalObjectStorageClient(objects={"index.html": b"east"}))
+    phoenix = ObjectStore("us-phoenix-1", "site", cache, "local", client=LocalObjectStorageClient(objects={"index.html": b"west"}))
+
+    assert b"east" == ashburn.getObject("index.html").content
+    assert b"west" == phoenix.getObject("index.html").content
+    assert 2 == cache.getStats()["entries"]
@@ -0,0 +1,59 @@
+import pytest
+
+from Configuration import Configuration
+from PathMatcher import PathMatcher
+
+
+def test_longest_prefix_wins():
+    matcher = PathMatcher()
+    matcher.add("/docs/", "docs")
+    matcher.add("/docs/private/", "private")
+    matcher.add("/", "root")
+
+    assert "private" == matcher.match("/docs/private/a.html")
+    assert "docs" == matcher.match("/docs/a.html")
+    assert "root" == matcher.match("/index.html")
+    assert None == PathMatcher().match("/index.html")
+    assert "none" == PathMatcher().match("/index.html", "none")
+
+
+def test_patterns_take_precedence_in_order():
+    matcher = PathMatcher()
+    matcher.add("/docs/private/", "prefix")
+    matcher.add("/docs/*.pdf", "glob")
+    matcher.add(r"re:^/docs/\d+/", "regex")
+    matcher.add("/docs/1/*", "later glob")
+
+    assert "glob" == matcher.match("/docs/private/a.pdf")
+    assert "regex" == matcher.match("/docs/1/a.html")
+    assert "glob" == matcher.match("/docs/1/a.pdf")
+    assert "prefix" == matcher.match("/docs/private/a.html")
+    assert 4 == len(matcher)
+
+
+@pytest.mark.parametrize("rule", ["docs/", "re:(unclosed"])
+def test_rejects_bad_rules(rule):
+    with pytest.raises(RuntimeError):
+        PathMatcher().add(rule, "x")
+
+
+def test_every_protected_path_is_protected():
+    config = Configuration({
+        "BucketName": "site",
+        "ProtectedPaths": "/members/, /reports/*.pdf, /admin/",
+        "PublicPaths": "/members/signup.html, /admin/help/",
+        "IDCSURL": "https://idcs.example.com",
+        "ClientID": "client",
+        "ClientSecret": "secret",
+    })
+    assert config.isConfigOK()
+
+    # not just the first rule in the list
+    assert config.isProtected("/admin/users.html")
+    assert config.isProtected("/reports/2021/q1.pdf")
+    assert config.isProtected("/members/")
+    # public carve outs, by longer prefix
+    assert not config.isProtected("/members/signup.html")
+    assert not config.isProtected("/admin/help/index.html")
+    assert not config.isProtected("/index.html")
+    assert not config.isProtected("/reports/summary.html")
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+from ObjectStore import StoredObject
+from Prefetch import Prefetcher, linkedAssets
+
+PAGE = """<html><head>
+<link rel="stylesheet" href="css/site.css">
+<link rel="icon" href="/favicon.ico">
+<script src="https://cdn.example.com/lib.js"></script>
+<script src="../js/app.js?v=3"></script>
+</head><body><img src="img/logo.png"><img src="data:image/png;base64,AAAA"><a href="/other.html">x</a></body></html>"""
+
+
+class StandInStore:
+    def __init__(self, objects):
+        self.objects = objects
+        self.fetched = []
+        self.headed = []
+        self.released = 0
+
+    def listObjects(self, prefix=None):
+        for name in sorted(self.objects):
+            if name.startswith(prefix or ""):
+                yield SimpleNamespace(name=name, size=len(self.objects[name]))
+
+    def headObject(self, objectname):
+        self.headed.append(objectname)
+        return StoredObject(objectname, None, {"Content-Length": str(len(self.objects[objectname]))})
+
+    def getObject(self, objectname):
+        self.fetched.append(objectname)
+        contentType = "text/html" if objectname.endswith(".html") else "application/octet-stream"
+        return StoredObject(objectname, self.objects[objectname], {"Content-Type": contentType})
+
+    def releaseBuffers(self):
+        self.released += 1
+
+
+def test_linked_assets():
+    assert ["docs/css/site.css", "favicon.ico", "js/app.js", "docs/img/logo.png"] == linkedAssets("/docs/index.html", PAGE)
+
+
+def test_prefetch_paths_and_links():
+    store = StandInStore({
+        "index.html": PAGE.encode(),
+        "css/site.css": b"body{}",
+        "favicon.ico": b"ico",
+        "img/logo.png": b"png",
+        "assets/a.js": b"a",
+        "assets/b.css": b"b",
+    })
+    prefetcher = Prefetcher(store, ["/", "/assets/*.js", "/missing.html"], 1024 * 1024, followLinks=True)
+    prefetcher.run()
+
+    # a missing object is a failure, not a crash
+    assert ["index.html", "assets/a.js", "css/site.css", "favicon.ico", "img/logo.png"] == store.fetched
+    assert 1 == prefetcher.getStats()["failures"]
+    # the listing already gave the glob's sizes
+    assert not "assets/a.js" in store.headed and "missing.html" in store.headed
+    assert len(store.fetched) + 1 == store.released
+
+
+def test_prefetch_budget():
+    store = StandInStore({"a.html": b"x" * 100, "b.html": b"y" * 100, "c.html": b"z"})
+    prefetcher = Prefetcher(store, ["/a.html", "/b.html", "/c.html"], 150)
+    prefetcher.run()
+
+    # b would go over the budget so is never fetched, but c still fits
+    assert ["a.html", "c.html"] == store.fetched
+    assert 1 == prefetcher.getStats()["skipped"]
+    assert 101 == prefetcher.getStats()["bytes"]
+
+
+def test_prefetch_skips_objects_too_big_to_cache():
+    store = StandInStore({"big.bin": b"x" * 1000, "small.bin": b"y" * 10, "page.html": b"z" * 1000})
+    prefetcher = Prefetcher(store, ["/*.bin", "/page.html"], 1024 * 1024, maxEntryBytes=500)
+    prefetcher.run()
+
+    assert ["small.bin"] == store.fetched
+    assert 2 == prefetcher.getStats()["skipped"]
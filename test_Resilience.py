@@ -0,0 +1,135 @@
+import threading
+import time
+
+import oci
+import pytest
+
+from LocalObjectStorage import LocalObjectStorageClient
+from ObjectCache import ObjectCache
+from ObjectStore import BufferBudget, ObjectStore
+from Resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, retryAfterHeader
+
+
+class FailingClient(LocalObjectStorageClient):
+    """A LocalObjectStorageClient that fails calls with the given statuses, in turn, before working again."""
+
+    def __init__(self, objects, failures):
+        super().__init__(objects=objects)
+        self.failures = list(failures)
+
+    def _fail(self, operation):
+        if self.failures:
+            self._call(operation)
+            status = self.failures.pop(0)
+            raise oci.exceptions.ServiceError(status, "Failed", {"Retry-After": "7"} if 429 == status else {}, "failed")
+
+    def get_namespace(self, **kwargs):
+        self._fail("get_namespace")
+        return super().get_namespace(**kwargs)
+
+    def get_object(self, namespace_name, bucket_name, object_name, **kwargs):
+        self._fail("get_object")
+        return super().get_object(namespace_name, bucket_name, object_name, **kwargs)
+
+
+def makeStore(client, cache=None, breaker=None, staleIfError=None):
+    return ObjectStore(None, "site", cache, "local", client=client, retry=RetryPolicy(2, backoff=0),
+                       breaker=breaker or CircuitBreaker("site", failures=3, resetAfter=60), staleIfError=staleIfError)
+
+
+def test_retries_transient_failures_but_not_missing_objects():
+    client = FailingClient({"index.html": b"<html/>"}, [503, 500])
+    store = makeStore(client)
+
+    assert b"<html/>" == store.getObject("index.html").content
+    assert 3 == client.getStats()["get_object"]
+    assert 2 == store.getUpstreamStats()["retries"]
+
+    with pytest.raises(oci.exceptions.ServiceError) as e:
+        store.getObject("missing.html")
+    assert 404 == e.value.status
+    assert 4 == client.getStats()["get_object"]
+
+    # asks for a longer wait than we'd make a visitor sit through: passed straight on
+    client.failures = [429]
+    with pytest.raises(oci.exceptions.ServiceError) as e:
+        store.getObject("index.html")
+    assert "7" == retryAfterHeader(e.value)
+
+
+def test_namespace_lookup_is_retried():
+    client = FailingClient({"index.html": b"<html/>"}, [503])
+    store = ObjectStore(None, "site", None, None, client=client, retry=RetryPolicy(2, backoff=0))
+
+    assert "local" == store.getNamespace()
+    assert 2 == client.getStats()["get_namespace"]
+    assert b"<html/>" == store.getObject("index.html").content
+
+
+def test_circuit_opens_and_recovers():
+    client = FailingClient({"index.html": b"<html/>"}, [503] * 3)
+    breaker = CircuitBreaker("site", failures=3, resetAfter=0.2)
+    store = makeStore(client, breaker=breaker)
+
+    with pytest.raises(oci.exceptions.ServiceError):
+        store.getObject("index.html")
+    assert CircuitBreaker.OPEN == breaker.getState()
+
+    # open: fails without calling Object Storage at all
+    with pytest.raises(CircuitOpenError) as e:
+        store.getObject("index.html")
+    assert 3 == client.getStats()["get_object"]
+    assert "1" == retryAfterHeader(e.value)
+
+    time.sleep(0.25)
+    assert b"<html/>" == store.getObject("index.html").content
+    assert CircuitBreaker.CLOSED == breaker.getState()
+
+
+def test_serves_stale_copy_when_object_storage_fails():
+    # a TTL of 0 means every cached copy is stale and needs revalidating
+    client = FailingClient({"index.html": b"<html/>"}, [])
+    store = makeStore(client, cache=ObjectCache(1024 * 1024, 1024 * 1024, 0))
+    cached = store.getObject("index.html")
+
+    client.failures = [503] * 3
+    assert cached is store.getObject("index.html")
+    assert b"html" == store.getObject("index.html", (1, 4)).content
+
+    strict = makeStore(client, cache=ObjectCache(1024 * 1024, 1024 * 1024, 0), staleIfError=0)
+    strict.getObject("index.html")
+    client.failures = [503] * 3
+    with pytest.raises(oci.exceptions.ServiceError):
+        strict.getObject("index.html")
+
+
+class CutOffClient(LocalObjectStorageClient):
+    """A LocalObjectStorageClient whose first get_object drops the connection half way through the body."""
+
+    def __init__(self, objects):
+        super().__init__(objects=objects)
+        self.cutOff = True
+
+    def get_object(self, namespace_name, bucket_name, object_name, **kwargs):
+        obj = super().get_object(namespace_name, bucket_name, object_name, **kwargs)
+        if self.cutOff:
+            self.cutOff = False
+            obj.data.raw.stream = lambda chunkSize, decode_content=True: iter([b"x" * 100])
+        return obj
+
+
+def test_retried_body_read_gives_back_its_buffers():
+    budget = BufferBudget(1000)
+    store = ObjectStore(None, "site", None, "local", budget=budget, client=CutOffClient({"a.bin": b"a" * 600}),
+                        retry=RetryPolicy(2, backoff=0))
+
+    def fetch():
+        obj = store.getObject("a.bin")
+        return obj.size(), budget.getInUse()
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fetch()), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive(), "blocked waiting on the buffer budget"
+    assert [(600, 600)] == result
@@ -0,0 +1,54 @@
+import time
+
+from Session import SessionManager, _b64decode, _b64encode
+
+
+def test_round_trip():
+    sessions = SessionManager("key", ttl=3600)
+
+    session = sessions.verify(sessions.issue("alice", {"name": "Alice"}))
+    assert "alice" == session["sub"]
+    assert "Alice" == session["name"]
+    assert abs(time.time() + 3600 - session["exp"]) < 5
+
+    # a different key can't verify it
+    assert None == SessionManager("other key").verify(sessions.issue("alice"))
+
+
+def test_rejects_tampering():
+    sessions = SessionManager("key")
+    payload, signature = sessions.issue("alice").rsplit(".", 1)
+
+    forged = _b64encode(_b64decode(payload).replace(b"alice", b"admin"))
+    assert None == sessions.verify(forged + "." + signature)
+    assert None == sessions.verify(payload + "." + signature[:-1] + ("B" if "A" == signature[-1] else "A"))
+    assert None == sessions.verify(payload)
+    assert None == sessions.verify("")
+    assert None == sessions.verify(None)
+
+
+def test_expiry_and_renewal(monkeypatch):
+    sessions = SessionManager("key", ttl=100)
+    now = time.time()
+    cookie = sessions.issue("alice", {"name": "Alice"})
+
+    monkeypatch.setattr(time, "time", lambda: now + 49)
+    session = sessions.verify(cookie)
+    assert not sessions.needsRenewal(session)
+
+    # past half its life it's renewed, keeping its claims
+    monkeypatch.setattr(time, "time", lambda: now + 51)
+    session = sessions.verify(cookie)
+    assert sessions.needsRenewal(session)
+    renewed = sessions.verify(sessions.renew(session))
+    assert ("alice", "Alice", int(now + 51) + 100) == (renewed["sub"], renewed["name"], renewed["exp"])
+
+    monkeypatch.setattr(time, "time", lambda: now + 101)
+    assert None == sessions.verify(cookie)
+
+
+def test_cookie_headers():
+    sessions = SessionManager("key", ttl=100)
+
+    assert "session=v; Path=/; Max-Age=100; HttpOnly; SameSite=Lax; Secure" == sessions.cookieHeader("v")
+    assert sessions.expiredCookieHeader().startswith("session=; Path=/; Max-Age=0;")
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from SingleFlight import SingleFlight
+
+
+def _burst(flights, key, fn, count=10):
+    results = []
+    errors = []
+
+    def call():
+        try:
+            results.append(flights.do(key, fn))
+        except (Exception) as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_concurrent_calls_share_one():
+    flights = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return b"body"
+
+    results, errors = _burst(flights, "index.html", fetch)
+
+    assert 1 == len(calls)
+    assert [] == errors
+    assert [b"body"] * 10 == [result for result, _ in results]
+    assert 9 == len([shared for _, shared in results if shared])
+    assert not flights.inFlight("index.html")
+
+
+def test_errors_are_shared():
+    flights = SingleFlight()
+
+    def fail():
+        time.sleep(0.2)
+        raise IOError("throttled")
+
+    results, errors = _burst(flights, "index.html", fail)
+
+    assert [] == results
+    assert 10 == len(errors)
+    assert 1 == flights.getStats()["calls"]
+
+
+def test_calls_after_completion_run_again():
+    flights = SingleFlight()
+
+    assert (1, False) == flights.do("a", lambda: 1)
+    assert (2, False) == flights.do("a", lambda: 2)
+    with pytest.raises(KeyError):
+        flights.do("b", lambda: {}["missing"])
+    assert 0 == flights.getStats()["inFlight"]
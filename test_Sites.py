@@ -0,0 +1,37 @@
+import pytest
+
+from Sites import SitePool, SiteRouter
+
+ROUTES = "www.example.com=site-www;example.com/docs/=us-ashburn-1:site-docs/v2/;*/blog/=site-blog/posts/"
+
+
+def test_routes_by_host_and_prefix():
+    router = SiteRouter().parse(ROUTES)
+
+    route = router.match("WWW.example.com:443", "/index.html")
+    assert ("site-www", None, "index.html") == (route.bucket, route.region, route.objectName("/index.html"))
+
+    route = router.match("example.com", "/docs/intro.html")
+    assert ("site-docs", "us-ashburn-1", "v2/intro.html") == (route.bucket, route.region, route.objectName("/docs/intro.html"))
+    # example.com has routes of its own so * doesn't apply to it
+    assert None == router.match("example.com", "/blog/a.html")
+
+    route = router.match("other.example.com", "/blog/a.html")
+    assert "posts/a.html" == route.objectName("/blog/a.html")
+    assert None == router.match("other.example.com", "/index.html")
+
+
+@pytest.mark.parametrize("setting", ["www.example.com", "www.example.com=", "example.com/docs/*=b", "example.com=us-ashburn-1:"])
+def test_rejects_bad_routes(setting):
+    with pytest.raises(RuntimeError):
+        SiteRouter().parse(setting)
+
+
+def test_pool_builds_each_site_once():
+    built = []
+    pool = SitePool(lambda region, bucket: built.append(bucket) or bucket.upper())
+
+    assert "A" == pool.get(None, "a")
+    assert "A" == pool.get(None, "a")
+    assert "B" == pool.get("us-phoenix-1", "b")
+    assert ["a", "b"] == built
@@ -0,0 +1,57 @@
+from LocalObjectStorage import LocalObjectStorageClient
+from ObjectCache import ObjectCache
+from ObjectStore import ObjectStore
+from Template import Template, TemplateRenderer
+
+PAGE = b"<html><body><p>Hello {{ name }}</p><a href=\"{{logoutURL}}\">Sign out</a></body></html>"
+
+
+def makeStore(objects):
+    return ObjectStore("us-ashburn-1", "site", namespace="local", client=LocalObjectStorageClient(objects=objects))
+
+
+def test_render_in_one_pass():
+    template = Template("index.html", '"1"', b"{{a}} and {{ b }}, {{a}}! {{ missing }}")
+
+    assert ["a", "b", "a", "missing"] == template.getKeys()
+    assert b"1 and 2, 1! {{ missing }}" == template.render({"a": b"1", "b": b"2"})
+    assert Template("plain.html", '"1"', b"<p>{ not a placeholder }</p>").isStatic()
+
+
+def test_personalise_escapes_and_varies_etag():
+    store = makeStore({"index.html": PAGE})
+    renderer = TemplateRenderer(ObjectCache(1024 * 1024, 1024 * 1024, 60))
+    original = store.getObject("index.html")
+
+    alice = renderer.personalise(store, original, TemplateRenderer.values({"sub": "alice", "name": "<Alice>"}, {"logoutURL": "/bye"}))
+    assert b"<p>Hello &lt;Alice&gt;</p><a href=\"/bye\">" in alice.content
+    assert str(len(alice.content)) == alice.headers["Content-Length"]
+    assert alice.getETag().startswith('W/"')
+    assert not "Last-Modified" in alice.headers
+    # the cached object itself is left alone
+    assert PAGE == original.content and original.getETag() != alice.getETag()
+
+    bob = renderer.personalise(store, original, TemplateRenderer.values({"sub": "bob"}, {"logoutURL": "/bye"}))
+    assert b"<p>Hello bob</p>" in bob.content
+    assert alice.getETag() != bob.getETag()
+
+
+def test_static_pages_pass_through_and_templates_follow_etag():
+    objects = {"plain.html": b"<p>Nothing to fill in</p>", "vue.html": b"<p>{{ message }}</p>", "index.html": PAGE}
+    store = makeStore(objects)
+    renderer = TemplateRenderer(ObjectCache(1024 * 1024, 1024 * 1024, 60))
+    values = TemplateRenderer.values({"sub": "alice"})
+
+    plain = store.getObject("plain.html")
+    assert plain is renderer.personalise(store, plain, values)
+    # nothing we know how to fill in, e.g. a Vue template
+    vue = store.getObject("vue.html")
+    assert vue is renderer.personalise(store, vue, values)
+
+    first = renderer.getTemplate(store, store.getObject("index.html"))
+    assert first is renderer.getTemplate(store, store.getObject("index.html"))
+
+    # a new version of the object gets a new template
+    objects["index.html"] = b"<p>Bye {{user}}</p>"
+    updated = store.getObject("index.html")
+    assert b"<p>Bye alice</p>" == renderer.personalise(store, updated, values).content
@@ -0,0 +1,221 @@
+import pytest
+
+from fdk import fixtures
+
+import func
+
+from FakeIDCS import FakeIDCS
+from Session import SessionManager
+from func import handler, handler_async
+
+# the module level state func builds on its first invocation
+FUNCTION_STATE = ["fnConfig", "myosc", "negotiator", "sitePool", "objectCache", "bufferBudget", "sessions", "oidc",
+                  "prefetcher", "accessLog", "templates", "coldStart", "_initialized"]
+
+
+@pytest.fixture
+def configured(monkeypatch, tmp_path):
+    """A freshly loaded function serving tmp_path as its bucket. Returns a function to add settings."""
+    for name in FUNCTION_STATE:
+        monkeypatch.setattr(func, name, False if "_initialized" == name else None)
+    (tmp_path / "index.html").write_bytes(b"<p>hi</p>")
+    for name, value in {"BucketName": "site", "Namespace": "local", "LocalBucketPath": str(tmp_path)}.items():
+        monkeypatch.setenv(name, value)
+    return monkeypatch.setenv
+
+
+@pytest.fixture
+def signedIn(configured, tmp_path):
+    """A function with /members/ protected by a FakeIDCS. Returns the headers of a signed in request."""
+    idp = FakeIDCS("democlient")
+    (tmp_path / "members").mkdir()
+    (tmp_path / "members" / "index.html").write_bytes(b"<p>Hi {{name}}, {{ message }}</p><a href='{{logoutURL}}'>Sign out</a>")
+    for name, value in {"ProtectedPaths": "/members/", "IDCSURL": idp.url, "ClientID": "democlient",
+                        "ClientSecret": "secret", "SessionKey": "test key"}.items():
+        configured(name, value)
+    cookie = SessionManager("test key").issue("alice", {"name": "<Alice>"})
+    yield {"Host": "site.example.com", "Cookie": "session=" + cookie}
+    idp.shutdown()
+
+
+async def get(url, headers):
+    call = await fixtures.setup_fn_call(handler, request_url=url, method="GET", headers=headers, gateway=True)
+    return await call
+
+
+async def invokeWithoutHTTP(fn):
+    """Invokes fn the way fn invoke / OCI Functions do outside of an API Gateway: no request URL or method."""
+    headers = {k: v for k, v in fixtures.setup_headers().items() if not k.lower().startswith("fn-http-")}
+    call = await fixtures.setup_fn_call_raw(fn, headers=headers)
+    return await call
+
+
+@pytest.mark.asyncio
+async def test_parse_request_without_data():
+    call = await fixtures.setup_fn_call(handler)
+
+    content, status, headers = await call
+
+    assert 500 == status
+    # assert {"message": "Hello World"} == json.loads(content)
+
+
+@pytest.mark.asyncio
+async def test_async_entry_point():
+    call = await fixtures.setup_fn_call(handler_async)
+
+    content, status, headers = await call
+
+    assert 500 == status
+
+
+@pytest.mark.asyncio
+async def test_debug_info_with_instrumentation(configured):
+    configured("Instrumentation", "true")
+
+    # the first invocation loads the configuration so it's the second that is timed
+    for _ in range(2):
+        content, status, headers = await invokeWithoutHTTP(handler)
+
+        assert 200 == status
+        assert "Configuration OK: True" in str(content)
+    assert any("server-timing" in name for name in headers)
+
+
+@pytest.mark.asyncio
+async def test_debug_info_is_access_logged(configured, caplog):
+    content, status, headers = await invokeWithoutHTTP(handler)
+
+    assert 200 == status
+    assert "Funtion loaded properly" in str(content)
+    lines = [r.getMessage() for r in caplog.records if "access" == r.name]
+    assert 1 == len(lines) and '"status":200' in lines[0]
+
+
+@pytest.mark.asyncio
+async def test_templated_page_keeps_unknown_placeholders(signedIn, configured):
+    configured("Templates", "true")
+
+    content, status, headers = await get("/members/", signedIn)
+
+    assert 200 == status
+    assert b"<p>Hi &lt;Alice&gt;, {{ message }}</p><a href='/logout/'>Sign out</a>" == bytes(content)
+    assert "private, no-cache" == headers["fn-http-h-cache-control"]
+
+
+@pytest.mark.asyncio
+async def test_logout_drops_the_session_cookie(signedIn):
+    content, status, headers = await get("/logout/", signedIn)
+
+    assert 302 == status
+    # FakeIDCS has no end_session_endpoint so there's nowhere else to sign out of
+    assert "/" == headers["fn-http-h-location"]
+    assert headers["fn-http-h-set-cookie"].startswith("session=; Path=/; Max-Age=0;")
+
+
+@pytest.mark.asyncio
+async def test_failed_set_up_is_tried_again(configured, monkeypatch):
+    realBuildSite = func.buildSite
+    calls = []
+
+    def flakyBuildSite(region, bucket):
+        calls.append(bucket)
+        if 1 == len(calls):
+            raise RuntimeError("Object Storage is down")
+        return realBuildSite(region, bucket)
+    monkeypatch.setattr(func, "buildSite", flakyBuildSite)
+
+    content, status, headers = await get("/", {"Host": "site.example.com"})
+    assert 500 == status
+    assert None == func.fnConfig and not func._initialized
+
+    content, status, headers = await get("/", {"Host": "site.example.com"})
+    assert 200 == status
+    assert b"<p>hi</p>" == bytes(content)
+
+
+@pytest.mark.asyncio
+async def test_sites_are_served_from_their_own_buckets(configured, tmp_path):
+    (tmp_path / "site-docs").mkdir()
+    (tmp_path / "site-docs" / "index.html").write_bytes(b"<p>docs</p>")
+    (tmp_path / "site-blog" / "posts").mkdir(parents=True)
+    (tmp_path / "site-blog" / "posts" / "index.html").write_bytes(b"<p>blog</p>")
+    configured("Sites", "docs.example.com=site-docs;*/blog/=site-blog/posts/")
+
+    for host, url, body in [("docs.example.com", "/", b"<p>docs</p>"), ("www.example.com", "/blog/", b"<p>blog</p>"),
+                            ("www.example.com", "/", b"<p>hi</p>"), ("docs.example.com", "/", b"<p>docs</p>")]:
+        content, status, headers = await get(url, {"Host": host})
+        assert 200 == status
+        assert body == bytes(content), "{}{}".format(host, url)
+
+    # docs.example.com has routes of its own so only its bucket is served there
+    content, status, headers = await get("/blog/", {"Host": "docs.example.com"})
+    assert 404 == status
+
+
+@pytest.mark.asyncio
+async def test_page_with_nothing_to_fill_in_is_fetched_once(signedIn, configured, tmp_path):
+    (tmp_path / "members" / "plain.html").write_bytes(b"<p>Members only</p>")
+    configured("Templates", "true")
+    configured("CacheMaxBytes", "0")
+
+    content, status, headers = await get("/members/plain.html", signedIn)
+
+    assert 200 == status
+    assert b"<p>Members only</p>" == bytes(content)
+    assert 1 == func.myosc.getClient().getStats()["get_object"]
+
+
+@pytest.mark.asyncio
+async def test_unchanged_page_is_not_modified(configured):
+    content, status, headers = await get("/", {"Host": "site.example.com"})
+    etag = headers["fn-http-h-etag"]
+    lastModified = headers["fn-http-h-last-modified"]
+
+    content, status, headers = await get("/", {"Host": "site.example.com", "If-None-Match": etag})
+    assert 304 == status
+    assert etag == headers["fn-http-h-etag"]
+    assert b"" == bytes(content or b"")
+
+    content, status, headers = await get("/", {"Host": "site.example.com", "If-Modified-Since": lastModified})
+    assert 304 == status
+
+    content, status, headers = await get("/", {"Host": "site.example.com", "If-None-Match": '"something else"'})
+    assert 200 == status
+    assert b"<p>hi</p>" == bytes(content)
+
+
+@pytest.mark.asyncio
+async def test_protected_pages_are_never_publicly_cacheable(signedIn, configured):
+    configured("CacheControl", "/=public, max-age=86400")
+
+    content, status, headers = await get("/members/", signedIn)
+    assert 200 == status
+    assert "private, max-age=86400" == headers["fn-http-h-cache-control"]
+
+    content, status, headers = await get("/members/", dict(signedIn, **{"If-None-Match": headers["fn-http-h-etag"]}))
+    assert 304 == status
+    assert "private, max-age=86400" == headers["fn-http-h-cache-control"]
+
+    content, status, headers = await get("/", signedIn)
+    assert "public, max-age=86400" == headers["fn-http-h-cache-control"]
+
+
+@pytest.mark.asyncio
+async def test_not_modified_carries_the_etag_of_the_negotiated_representation(configured, tmp_path):
+    (tmp_path / "site.css").write_bytes(b"body { margin: 0 }\n" * 200)
+    compressed = {"Host": "site.example.com", "Accept-Encoding": "gzip"}
+
+    content, status, headers = await get("/site.css", compressed)
+    assert "gzip" == headers["fn-http-h-content-encoding"]
+    etag = headers["fn-http-h-etag"]
+    assert etag.startswith('W/"')
+
+    content, status, headers = await get("/site.css", dict(compressed, **{"If-None-Match": etag}))
+    assert 304 == status
+    assert etag == headers["fn-http-h-etag"]
+
+    # an identity copy has the strong ETag, and so does its 304
+    content, status, headers = await get("/site.css", {"Host": "site.example.com", "If-None-Match": etag})
+    assert 304 == status
+    assert not headers["fn-http-h-etag"].startswith("W/")